@@ -0,0 +1,114 @@
+"""
+Benchmark: full vs halfvec vs binary-quantized component search
+Recall@k is measured against an exact scan (no index) on the full vectors.
+
+Usage:
+    python benchmark_quantized_search.py [--queries 100] [--limit 10] [--shortlist 100] [--build]
+"""
+
+import sys
+import os
+import time
+import argparse
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from src.postgres_db import PostgresDB
+
+
+def sample_queries(db, n):
+    """Use stored component embeddings as queries"""
+    rows = db._fetch("""
+        SELECT embedding FROM components
+        WHERE embedding IS NOT NULL
+        ORDER BY random()
+        LIMIT %s
+    """, (n,))
+    return [r[0] for r in rows]
+
+
+def exact_ids(db, vector, limit):
+    """Ground truth: exact distance sort, index scans disabled"""
+    with db.cursor() as cur:
+        cur.execute("BEGIN")
+        cur.execute("SET LOCAL enable_indexscan = off")
+        cur.execute("""
+            SELECT id FROM components
+            ORDER BY embedding <=> %s::vector
+            LIMIT %s
+        """, (vector, limit))
+        ids = [r[0] for r in cur.fetchall()]
+        cur.execute("COMMIT")
+    return ids
+
+
+def index_sizes(db):
+    rows = db._fetch("""
+        SELECT indexrelname, pg_size_pretty(pg_relation_size(indexrelid))
+        FROM pg_stat_user_indexes
+        WHERE relname = 'components' AND indexrelname LIKE 'idx_component_embedding%'
+        ORDER BY indexrelname
+    """)
+    return rows
+
+
+def run(db, queries, limit, shortlist):
+    truth = [set(exact_ids(db, q, limit)) for q in queries]
+    
+    modes = {
+        "full (vector)": lambda q: db.search_components(q, limit=limit),
+        "half (halfvec)": lambda q: db.search_components_quantized(q, limit=limit, mode="half"),
+        f"binary -> rerank {shortlist}": lambda q: db.search_components_quantized(
+            q, limit=limit, mode="binary", shortlist=shortlist
+        ),
+    }
+    
+    print(f"\n{'mode':<28} {'recall@' + str(limit):>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, search in modes.items():
+        latencies, hits = [], 0
+        for q, expected in zip(queries, truth):
+            start = time.perf_counter()
+            results = search(q)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected & {r['id'] for r in results})
+        
+        latencies.sort()
+        recall = hits / max(sum(len(t) for t in truth), 1)
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        print(f"{name:<28} {recall:>10.3f} {p50:>8.1f} {p95:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantized component search benchmark")
+    parser.add_argument("--queries", type=int, default=100, help="Number of sampled queries")
+    parser.add_argument("--limit", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--shortlist", type=int, default=100, help="Binary candidates to rerank")
+    parser.add_argument("--build", action="store_true", help="Create the halfvec / bit HNSW indexes first")
+    args = parser.parse_args(argv)
+    
+    db = PostgresDB()
+    try:
+        if args.build:
+            print("Building quantized indexes...")
+            start = time.perf_counter()
+            db.create_quantized_indexes()
+            print(f"  Done in {time.perf_counter() - start:.1f}s")
+        
+        print("Index sizes:")
+        for name, size in index_sizes(db):
+            print(f"  {name:<36} {size}")
+        
+        queries = sample_queries(db, args.queries)
+        if not queries:
+            print("No component embeddings found. Run: python migrate_to_postgres.py embeddings")
+            return
+        
+        run(db, queries, args.limit, args.shortlist)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
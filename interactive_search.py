@@ -11,6 +11,10 @@ from src.llm.llm_parser import LLMParser
 from src.text_embedder import TextEmbedder
 from src.reranker import LocalReranker
 
+# Hybrid (lexical + vector) candidates are handed to the cross-encoder reranker;
+# fused ranking lets it score fewer of them than the vector-only search (was 20)
+CANDIDATE_POOL = 10
+
 def print_separator():
     print("\n" + "="*70)
 
@@ -40,7 +44,7 @@ def search_interactive():
     """
     print_separator()
     print("Interactive Project Search (Schema V2)")
-    print("Features: Metadata Filtering + Vector Semantic Search")
+    print("Features: Metadata Filtering + Full-Text + Vector Semantic Search")
     print_separator()
     
     # Initialize components
@@ -97,13 +101,14 @@ def search_interactive():
         print("\nGenerating embedding...")
         query_vector = text_embedder.embed(semantic_query)
         
-        # Step 3: Execute hybrid search
+        # Step 3: Execute hybrid search (full-text on the query's content words + vector, fused with RRF)
         print(f"Searching database for candidates...")
         
-        candidates = db.search_projects(
+        candidates = db.search_projects_hybrid(
+            query_text=user_query,
             query_vector=query_vector,
             filters=filters,
-            limit=20  # Fetch more candidates for reranking
+            limit=CANDIDATE_POOL  # Candidates for reranking
         )
         
         if not candidates:
@@ -144,7 +149,8 @@ def main():
         
         parsed = llm.parse_query_v2(query)
         vector = text_embedder.embed(parsed.get('semantic_query', query))
-        results = db.search_projects(query_vector=vector, filters=parsed.get('filters', {}), limit=5)
+        results = db.search_projects_hybrid(query_text=query, query_vector=vector,
+                                            filters=parsed.get('filters', {}), limit=5)
         
         print(f"\nQuery: {query}")
         print(f"Found {len(results)} results:\n")
@@ -4,16 +4,35 @@ Migration Script for Component-Based Image Search System
 This script imports data from metadata.json files into the new PostgreSQL schema
 with projects, project_images, and components tables.
 
+Ingestion runs as a staged pipeline:
+    1. Decode   - worker threads open + preprocess images into a bounded queue
+    2. Embed    - CLIP encodes full batches of images
+    3. Write    - execute_values bulk upserts, one transaction per chunk of projects
+Finished projects are recorded in a checkpoint file so a crashed run can resume.
+
 Usage:
     python migrate_to_postgres.py              # Full migration (drop + recreate)
     python migrate_to_postgres.py --no-drop    # Import without dropping tables
+    python migrate_to_postgres.py --resume     # Continue an interrupted run (implies --no-drop)
+    python migrate_to_postgres.py --workers 8 --batch-size 64 --chunk-size 50
+    python migrate_to_postgres.py --bulk-load  # Drop HNSW indexes, load, build them once at the end
+    python migrate_to_postgres.py embeddings        # Backfill missing component embeddings
+    python migrate_to_postgres.py embeddings --all  # Re-embed every component (after a model change)
+    python migrate_to_postgres.py embeddings --all --bulk-load
+
+HNSW build options (with --bulk-load):
+    --hnsw-m 16 --hnsw-ef-construction 64 --maintenance-work-mem 2GB --index-workers 4
 """
 
 import os
 import sys
 import json
+import time
+import argparse
 from pathlib import Path
 
+from psycopg2.extras import execute_values
+
 # Add project root
 sys.path.append(os.getcwd())
 
@@ -21,14 +40,223 @@ from src.postgres_db import PostgresDB
 from src.embedding import ImageEmbedder
 
 
-def main():
+CHECKPOINT_FILE = ".migrate_checkpoint.json"
+
+
+def load_checkpoint(path):
+    """Return the set of project codes already migrated"""
+    path = Path(path)
+    if not path.exists():
+        return set()
+    with open(path, 'r', encoding='utf-8') as f:
+        return set(json.load(f).get("completed", []))
+
+
+def save_checkpoint(path, completed):
+    """Atomically write the checkpoint (tmp file + rename)"""
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"completed": sorted(completed)}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_project(project_dir):
+    """Read metadata.json of a project folder (None if missing)"""
+    meta_path = project_dir / "metadata.json"
+    if not meta_path.exists():
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def embed_images(image_embedder, image_paths, workers=4, batch_size=32):
+    """
+    Decode images in a worker pool and encode them in full batches
+
+    Returns:
+        List aligned with image_paths: 1D numpy embedding or None
+    """
+    embeddings = [None] * len(image_paths)
+
+    # Missing files keep a None embedding (image row is still inserted)
+    existing = [i for i, path in enumerate(image_paths) if path is not None and path.exists()]
+
+    # Unreadable images are skipped by the decoder; a pipeline failure (e.g. a broken
+    # worker pool) propagates so the chunk is not checkpointed as done
+    for indices, vectors in image_embedder.iter_embeddings(
+            [image_paths[i] for i in existing], batch_size=batch_size, num_workers=workers):
+        for i, vec in zip(indices, vectors):
+            embeddings[existing[i]] = vec
+
+    return embeddings
+
+
+def write_chunk(db, chunk):
+    """
+    Bulk upsert one chunk of projects in a single transaction
+
+    Args:
+        chunk: list of (project_dir, metadata, [(img_data, embedding), ...])
+
+    Returns:
+        (n_projects, n_images, n_components)
+    """
+    # Dedupe on conflict keys: ON CONFLICT DO UPDATE cannot touch a row twice per statement
+    project_rows = {}
+    for project_dir, metadata, _ in chunk:
+        tech_stack = metadata.get("tech_stack", {})
+        project_rows[metadata.get("project_id")] = (
+            metadata.get("project_id"),
+            metadata.get("title", "Unknown"),
+            metadata.get("repo_url", ""),
+            metadata.get("domain", ""),
+            tech_stack.get("frontend", []),
+            tech_stack.get("backend", []),
+            tech_stack.get("database", [])
+        )
+
+    with db.conn.cursor() as cur:
+        returned = execute_values(cur, """
+            INSERT INTO projects (project_code, title, repo_url, domain, frontend, backend, database)
+            VALUES %s
+            ON CONFLICT (project_code) DO UPDATE SET
+                title = EXCLUDED.title,
+                repo_url = EXCLUDED.repo_url,
+                domain = EXCLUDED.domain,
+                frontend = EXCLUDED.frontend,
+                backend = EXCLUDED.backend,
+                database = EXCLUDED.database,
+                updated_at = now()
+            RETURNING id, project_code
+        """, list(project_rows.values()), fetch=True)
+        project_ids = {code: uuid for uuid, code in returned}
+
+        # Key = the row's identity in project_images: image_id (the conflict key),
+        # or (project, path) for images without one
+        image_rows = {}
+        image_keys = []
+        for project_dir, metadata, images in chunk:
+            project_uuid = project_ids[metadata.get("project_id")]
+            for img_data, embedding in images:
+                full_path = str(project_dir / img_data.get("image_path"))
+                key = img_data.get("image_id") or (str(project_uuid), full_path)
+                image_keys.append(key)
+                image_rows[key] = (
+                    project_uuid,
+                    img_data.get("image_id"),
+                    full_path,
+                    img_data.get("page_name"),
+                    embedding
+                )
+
+        image_ids = {}
+        if image_rows:
+            returned = execute_values(cur, """
+                INSERT INTO project_images (project_id, image_id, image_path, page_name, embedding)
+                VALUES %s
+                ON CONFLICT (image_id) DO UPDATE SET
+                    page_name = EXCLUDED.page_name,
+                    embedding = EXCLUDED.embedding
+                RETURNING id, image_id, project_id, image_path
+            """, list(image_rows.values()), template="(%s, %s, %s, %s, %s::vector)", fetch=True)
+            if len(returned) != len(image_rows):
+                raise RuntimeError(f"Inserted {len(image_rows)} images but got {len(returned)} ids back")
+            image_ids = {
+                image_id or (str(project_id), path): db_id
+                for db_id, image_id, project_id, path in returned
+            }
+
+        component_rows = {}
+        keys = iter(image_keys)
+        for project_dir, metadata, images in chunk:
+            project_uuid = project_ids[metadata.get("project_id")]
+            for img_data, _ in images:
+                db_image_id = image_ids[next(keys)]
+                for comp in img_data.get("components", []):
+                    source_code = comp.get("source_code", {})
+                    component_rows[comp.get("component_id")] = (
+                        db_image_id,
+                        project_uuid,
+                        comp.get("component_id"),
+                        comp.get("type"),
+                        comp.get("name"),
+                        comp.get("semantic_tags", []),
+                        comp.get("description", ""),
+                        source_code.get("file_path"),
+                        source_code.get("start_line"),
+                        source_code.get("end_line")
+                    )
+
+        if component_rows:
+            execute_values(cur, """
+                INSERT INTO components (
+                    image_id, project_id, component_id, component_type, component_name,
+                    semantic_tags, description,
+                    source_file_path, source_start_line, source_end_line
+                )
+                VALUES %s
+                ON CONFLICT (component_id) DO UPDATE SET
+                    component_type = EXCLUDED.component_type,
+                    component_name = EXCLUDED.component_name,
+                    semantic_tags = EXCLUDED.semantic_tags,
+                    description = EXCLUDED.description,
+                    source_file_path = EXCLUDED.source_file_path,
+                    source_start_line = EXCLUDED.source_start_line,
+                    source_end_line = EXCLUDED.source_end_line
+            """, list(component_rows.values()))
+
+    return len(project_rows), len(image_rows), len(component_rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate dataset/ into PostgreSQL")
+    parser.add_argument("--no-drop", action="store_true", help="Import without dropping tables")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip projects recorded in the checkpoint (implies --no-drop)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="Checkpoint file path")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1),
+                        help="Image decode threads")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per CLIP batch")
+    parser.add_argument("--chunk-size", type=int, default=50, help="Projects per DB transaction")
+    add_index_args(parser)
+    return parser.parse_args(argv)
+
+
+def add_index_args(parser):
+    """Deferred HNSW build options (shared by the migration and the embeddings backfill)"""
+    parser.add_argument("--bulk-load", action="store_true",
+                        help="Drop the HNSW indexes before loading and build them once at the end")
+    parser.add_argument("--hnsw-m", type=int, default=16, help="HNSW m")
+    parser.add_argument("--hnsw-ef-construction", type=int, default=64, help="HNSW ef_construction")
+    parser.add_argument("--maintenance-work-mem", default="1GB", help="maintenance_work_mem for the build")
+    parser.add_argument("--index-workers", type=int, default=None,
+                        help="max_parallel_maintenance_workers for the build")
+
+
+def build_indexes(db, args, names=None):
+    """Build the HNSW indexes dropped by --bulk-load and report the build time"""
+    print("\n[Index] Building HNSW indexes...")
+    timings = db.build_vector_indexes(
+        m=args.hnsw_m,
+        ef_construction=args.hnsw_ef_construction,
+        maintenance_work_mem=args.maintenance_work_mem,
+        workers=args.index_workers,
+        names=names
+    )
+    print(f"  ✓ Index build time: {sum(timings.values()):.1f}s")
+    return timings
+
+
+def main(argv=None):
     """Main migration function"""
+    args = parse_args(argv)
+
     print("=" * 70)
     print(" Component-Based Image Search - Database Migration")
     print("=" * 70)
     
-    # Check for --no-drop flag
-    drop_tables = "--no-drop" not in sys.argv
+    drop_tables = not (args.no_drop or args.resume)
     
     # 1. Initialize Database
     db = PostgresDB()
@@ -48,14 +276,26 @@ def main():
                 DROP TABLE IF EXISTS project_assets CASCADE;
             """)
         db.conn.commit()
+        
+        print("  -> Creating new tables from schema.sql...")
+        db.init_schema_from_file("schema.sql")
+        
+        # Fresh database -> old checkpoint is meaningless
+        if Path(args.checkpoint).exists():
+            os.remove(args.checkpoint)
+    else:
+        print("  -> Keeping existing tables")
     
-    print("  -> Creating new tables from schema.sql...")
-    db.init_schema_from_file("schema.sql")
+    if args.bulk_load:
+        # Inserts skip incremental HNSW maintenance; graphs are built once at the end
+        print("  -> Bulk load: dropping HNSW indexes")
+        db.drop_vector_indexes()
     
     # 3. Load Image Embedder
     print("\n[Step 2] Loading AI Models...")
     print("  -> Loading CLIP Image Embedder (ViT-B/32)...")
     image_embedder = ImageEmbedder()
+    image_embedder.warmup()
     print("  -> Models loaded!")
     
     # 4. Scan Dataset
@@ -65,165 +305,84 @@ def main():
         return
     
     projects = sorted(list(dataset_dir.glob("project_*")))
+    completed = load_checkpoint(args.checkpoint) if args.resume else set()
+    pending = [p for p in projects if p.name not in completed]
+    
     print(f"\n[Step 3] Found {len(projects)} projects to migrate")
+    if completed:
+        print(f"  -> Resuming: {len(projects) - len(pending)} already done, {len(pending)} left")
     
-    # 5. Migrate Each Project
-    print("\n[Step 4] Migrating Projects...\n")
+    # 5. Migrate in chunks: decode -> embed -> bulk write (1 transaction per chunk)
+    print(f"\n[Step 4] Migrating Projects "
+          f"(workers={args.workers}, batch={args.batch_size}, chunk={args.chunk_size})...\n")
     print("-" * 70)
     
     total_projects = 0
     total_images = 0
     total_components = 0
+    start_time = time.time()
     
-    for idx, project_dir in enumerate(projects, 1):
-        meta_path = project_dir / "metadata.json"
-        images_dir = project_dir / "images"
-        
-        if not meta_path.exists():
-            print(f"  [{idx}] SKIP: {project_dir.name} - No metadata.json")
-            continue
+    db.conn.autocommit = False
+    
+    for chunk_start in range(0, len(pending), args.chunk_size):
+        chunk_dirs = pending[chunk_start:chunk_start + args.chunk_size]
         
         # Load metadata
-        with open(meta_path, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
+        loaded = []
+        for project_dir in chunk_dirs:
+            metadata = load_project(project_dir)
+            if metadata is None:
+                print(f"  SKIP: {project_dir.name} - No metadata.json")
+                completed.add(project_dir.name)
+                continue
+            loaded.append((project_dir, metadata))
         
-        project_code = metadata.get("project_id")
-        title = metadata.get("title", "Unknown")
-        repo_url = metadata.get("repo_url", "")
-        domain = metadata.get("domain", "")
-        tech_stack = metadata.get("tech_stack", {})
+        # Decode + embed every image of the chunk in full batches
+        image_jobs = [
+            (project_dir, img_data)
+            for project_dir, metadata in loaded
+            for img_data in metadata.get("images", [])
+        ]
+        image_paths = [
+            project_dir / img_data["image_path"] if img_data.get("image_path") else None
+            for project_dir, img_data in image_jobs
+        ]
+        embeddings = embed_images(image_embedder, image_paths, args.workers, args.batch_size)
         
-        print(f"\n  [{idx}/{len(projects)}] {title}")
-        print(f"       Code: {project_code}")
-        print(f"       Repo: {repo_url}")
+        chunk = []
+        job_idx = 0
+        for project_dir, metadata in loaded:
+            images = []
+            for img_data in metadata.get("images", []):
+                images.append((img_data, embeddings[job_idx]))
+                job_idx += 1
+            chunk.append((project_dir, metadata, images))
         
+        # Bulk write
         try:
-            # Insert Project
-            with db.conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO projects (project_code, title, repo_url, domain, frontend, backend, database)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (project_code) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        repo_url = EXCLUDED.repo_url,
-                        domain = EXCLUDED.domain,
-                        frontend = EXCLUDED.frontend,
-                        backend = EXCLUDED.backend,
-                        database = EXCLUDED.database,
-                        updated_at = now()
-                    RETURNING id
-                """, (
-                    project_code,
-                    title,
-                    repo_url,
-                    domain,
-                    tech_stack.get("frontend", []),
-                    tech_stack.get("backend", []),
-                    tech_stack.get("database", [])
-                ))
-                project_uuid = cur.fetchone()[0]
-            
+            n_projects, n_images, n_components = write_chunk(db, chunk)
             db.conn.commit()
-            total_projects += 1
-            
-            # Process Images
-            images_data = metadata.get("images", [])
-            project_images_count = 0
-            project_components_count = 0
-            
-            for img_data in images_data:
-                image_id = img_data.get("image_id")
-                image_path = img_data.get("image_path")
-                page_name = img_data.get("page_name")
-                components = img_data.get("components", [])
-                
-                # Full image path
-                full_image_path = project_dir / image_path
-                
-                # Generate image embedding
-                image_embedding = None
-                if full_image_path.exists():
-                    try:
-                        embedding_result = image_embedder.embed_image(str(full_image_path))
-                        # embed_image returns numpy array with shape (1, 512), flatten it
-                        image_embedding = embedding_result.flatten().tolist()
-                    except Exception as e:
-                        print(f"       [WARN] Could not embed image: {e}")
-                
-                # Insert Image
-                with db.conn.cursor() as cur:
-                    cur.execute("""
-                        INSERT INTO project_images (project_id, image_id, image_path, page_name, embedding)
-                        VALUES (%s, %s, %s, %s, %s::vector)
-                        ON CONFLICT (image_id) DO UPDATE SET
-                            page_name = EXCLUDED.page_name,
-                            embedding = EXCLUDED.embedding
-                        RETURNING id
-                    """, (
-                        project_uuid,
-                        image_id,
-                        str(project_dir / image_path),
-                        page_name,
-                        image_embedding
-                    ))
-                    db_image_id = cur.fetchone()[0]
-                
-                db.conn.commit()
-                project_images_count += 1
-                
-                # Process Components
-                for comp in components:
-                    component_id = comp.get("component_id")
-                    component_type = comp.get("type")
-                    component_name = comp.get("name")
-                    semantic_tags = comp.get("semantic_tags", [])
-                    description = comp.get("description", "")
-                    source_code = comp.get("source_code", {})
-                    
-                    # Insert Component
-                    with db.conn.cursor() as cur:
-                        cur.execute("""
-                            INSERT INTO components (
-                                image_id, project_id, component_id, component_type, component_name,
-                                semantic_tags, description,
-                                source_file_path, source_start_line, source_end_line
-                            )
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (component_id) DO UPDATE SET
-                                component_type = EXCLUDED.component_type,
-                                component_name = EXCLUDED.component_name,
-                                semantic_tags = EXCLUDED.semantic_tags,
-                                description = EXCLUDED.description,
-                                source_file_path = EXCLUDED.source_file_path,
-                                source_start_line = EXCLUDED.source_start_line,
-                                source_end_line = EXCLUDED.source_end_line
-                            RETURNING id
-                        """, (
-                            db_image_id,
-                            project_uuid,
-                            component_id,
-                            component_type,
-                            component_name,
-                            semantic_tags,
-                            description,
-                            source_code.get("file_path"),
-                            source_code.get("start_line"),
-                            source_code.get("end_line")
-                        ))
-                    
-                    project_components_count += 1
-                
-                db.conn.commit()
-            
-            total_images += project_images_count
-            total_components += project_components_count
-            
-            print(f"       ✓ {project_images_count} images, {project_components_count} components")
-            
         except Exception as e:
-            print(f"       ✗ Error: {e}")
             db.conn.rollback()
+            print(f"  ✗ Error writing chunk starting at {chunk_dirs[0].name}: {e}")
             continue
+        
+        completed.update(project_dir.name for project_dir, _ in loaded)
+        save_checkpoint(args.checkpoint, completed)
+        
+        total_projects += n_projects
+        total_images += n_images
+        total_components += n_components
+        
+        done = chunk_start + len(chunk_dirs)
+        elapsed = time.time() - start_time
+        print(f"  ✓ [{done}/{len(pending)}] {n_projects} projects, {n_images} images, "
+              f"{n_components} components ({total_images / max(elapsed, 1e-6):.1f} img/s)")
+    
+    db.conn.autocommit = True
+    
+    if args.bulk_load:
+        build_indexes(db, args)
     
     # 6. Summary
     print("\n" + "-" * 70)
@@ -233,82 +392,156 @@ def main():
     print(f"  ✓ Projects:   {total_projects}")
     print(f"  ✓ Images:     {total_images}")
     print(f"  ✓ Components: {total_components}")
+    print(f"  ✓ Time:       {time.time() - start_time:.1f}s")
     print("\n[DONE] Migration Complete!\n")
     
     db.close()
 
 
-def generate_component_embeddings():
+def _crop_boxes(img, bboxes):
+    """
+    Convert JSONB bboxes ({"x","y","w","h"}) into [x, y, w, h] clamped to the image
+    Missing bbox -> whole image. Returns None for boxes with no area inside the image.
+    """
+    img_h, img_w = img.shape[:2]
+    boxes = []
+    for bbox in bboxes:
+        if not bbox:
+            boxes.append([0, 0, img_w, img_h])
+            continue
+        x = max(0, int(bbox.get('x', 0)))
+        y = max(0, int(bbox.get('y', 0)))
+        w = min(int(bbox.get('w', img_w)), img_w - x)
+        h = min(int(bbox.get('h', img_h)), img_h - y)
+        boxes.append([x, y, w, h] if w > 0 and h > 0 else None)
+    return boxes
+
+
+def _flush_component_embeddings(db, updates):
+    """One bulk UPDATE ... FROM (VALUES ...) for a batch of (component id, vector)"""
+    if not updates:
+        return
+    with db.conn.cursor() as cur:
+        execute_values(cur, """
+            UPDATE components AS c
+            SET embedding = v.embedding, updated_at = now()
+            FROM (VALUES %s) AS v(id, embedding)
+            WHERE c.id = v.id
+        """, updates, template="(%s, %s::vector)", page_size=len(updates))
+    db.conn.commit()
+
+
+def generate_component_embeddings(reembed_all=False, batch_size=32, write_batch=500, index_args=None):
     """
     Generate CLIP embeddings for all components by cropping from images.
     Run this after initial migration.
+    
+    Rows are streamed with a server-side cursor ordered by image_path, so each
+    screenshot is decoded once and all of its crops go through one batch_embed call.
+    Vectors are written back with one bulk UPDATE per `write_batch` components.
+    
+    Args:
+        reembed_all: Re-embed every component (e.g. after a model change),
+                     not only the ones without an embedding
+        batch_size: Crops per CLIP forward pass
+        write_batch: Components per bulk UPDATE / commit
+        index_args: parsed add_index_args() options; with bulk_load the component
+                    HNSW index is dropped during the backfill and rebuilt at the end
     """
     print("=" * 70)
     print(" Generate Component Embeddings")
     print("=" * 70)
     
+    import cv2
+    from itertools import groupby
     from src.component_embedder import ComponentEmbedder
-    from PIL import Image
     
     db = PostgresDB()
     embedder = ComponentEmbedder()
+    embedder.warmup()
+    
+    where = "" if reembed_all else "WHERE c.embedding IS NULL"
     
-    # Get components without embeddings
     with db.conn.cursor() as cur:
-        cur.execute("""
+        cur.execute(f"SELECT COUNT(*) FROM components c {where}")
+        total = cur.fetchone()[0]
+    
+    print(f"\nFound {total} components to embed\n")
+    
+    bulk_load = index_args is not None and index_args.bulk_load
+    if bulk_load:
+        db.drop_vector_indexes(["idx_component_embedding"])
+    
+    success = 0
+    processed = 0
+    updates = []
+    start_time = time.time()
+    
+    db.conn.autocommit = False
+    
+    # withhold=True keeps the server-side cursor open across the per-batch commits
+    with db.conn.cursor(name="component_backfill", withhold=True) as read_cur:
+        read_cur.itersize = 2000
+        read_cur.execute(f"""
             SELECT c.id, c.component_id, c.bbox, pi.image_path
             FROM components c
             JOIN project_images pi ON c.image_id = pi.id
-            WHERE c.embedding IS NULL
-            ORDER BY c.id
+            {where}
+            ORDER BY pi.image_path, c.id
         """)
-        components = cur.fetchall()
-    
-    print(f"\nFound {len(components)} components without embeddings\n")
-    
-    success = 0
-    for idx, (comp_id, component_id, bbox, image_path) in enumerate(components, 1):
-        print(f"  [{idx}/{len(components)}] {component_id}...", end=" ")
         
-        if not Path(image_path).exists():
-            print("Image not found")
-            continue
-        
-        try:
-            # Load image
-            img = Image.open(image_path).convert("RGB")
+        for image_path, rows in groupby(read_cur, key=lambda r: r[3]):
+            rows = list(rows)
+            processed += len(rows)
             
-            # If we have bbox, crop the component
-            if bbox:
-                x, y, w, h = bbox.get('x', 0), bbox.get('y', 0), bbox.get('w', img.width), bbox.get('h', img.height)
-                cropped = img.crop((x, y, x + w, y + h))
-            else:
-                cropped = img
+            # Decode each screenshot once for all of its components
+            img = cv2.imread(image_path) if Path(image_path).exists() else None
+            if img is None:
+                print(f"  [{processed}/{total}] {image_path}: image not found ({len(rows)} components skipped)")
+                continue
             
-            # Generate embedding
-            embedding = embedder.embed_image(cropped)
-            embedding_list = embedding.tolist() if hasattr(embedding, 'tolist') else list(embedding)
+            boxes = _crop_boxes(img, [r[2] for r in rows])
+            valid = [(r[0], box) for r, box in zip(rows, boxes) if box is not None]
+            if not valid:
+                continue
             
-            # Update database
-            with db.conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE components SET embedding = %s::vector WHERE id = %s
-                """, (embedding_list, comp_id))
+            try:
+                vectors = embedder.batch_embed(img, [box for _, box in valid], batch_size=batch_size)
+            except Exception as e:
+                print(f"  [{processed}/{total}] {image_path}: Error {str(e)[:40]}")
+                continue
             
-            db.conn.commit()
-            print("✓")
-            success += 1
+            updates.extend((comp_id, vec) for (comp_id, _), vec in zip(valid, vectors))
+            success += len(valid)
             
-        except Exception as e:
-            print(f"Error: {str(e)[:40]}")
-            db.conn.rollback()
+            if len(updates) >= write_batch:
+                _flush_component_embeddings(db, updates)
+                updates = []
+                print(f"  [{processed}/{total}] {success} embedded "
+                      f"({success / max(time.time() - start_time, 1e-6):.1f} comp/s)")
+        
+        _flush_component_embeddings(db, updates)
+    
+    db.conn.autocommit = True
+    
+    if bulk_load:
+        build_indexes(db, index_args, ["idx_component_embedding"])
     
-    print(f"\n[DONE] Generated {success}/{len(components)} embeddings\n")
+    print(f"\n[DONE] Generated {success}/{total} embeddings in {time.time() - start_time:.1f}s\n")
     db.close()
 
 
+def parse_embeddings_args(argv):
+    parser = argparse.ArgumentParser(description="Backfill component embeddings")
+    parser.add_argument("--all", action="store_true", help="Re-embed every component")
+    parser.add_argument("--batch-size", type=int, default=32, help="Crops per CLIP batch")
+    add_index_args(parser)
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "embeddings":
-        generate_component_embeddings()
+        args = parse_embeddings_args(sys.argv[2:])
+        generate_component_embeddings(reembed_all=args.all, batch_size=args.batch_size, index_args=args)
     else:
         main()
@@ -112,6 +112,20 @@ ON project_images USING hnsw (embedding vector_cosine_ops);
 CREATE INDEX IF NOT EXISTS idx_component_embedding
 ON components USING hnsw (embedding vector_cosine_ops);
 
+-- Per-type partial HNSW indexes (optional, see PostgresDB.create_component_type_indexes)
+-- CREATE INDEX idx_component_embedding_header
+-- ON components USING hnsw (embedding vector_cosine_ops)
+-- WHERE component_type = 'header';
+
+-- Quantized HNSW indexes (optional, pgvector >= 0.7, see PostgresDB.create_quantized_indexes)
+-- components keeps a single full-precision `embedding` column: the halfvec and bit
+-- copies exist only inside these expression indexes (no extra halfvec/bit columns).
+-- Binary search reranks its Hamming shortlist on the full-precision column.
+-- CREATE INDEX idx_component_embedding_half
+-- ON components USING hnsw ((embedding::halfvec(512)) halfvec_cosine_ops);
+-- CREATE INDEX idx_component_embedding_bit
+-- ON components USING hnsw ((binary_quantize(embedding)::bit(512)) bit_hamming_ops);
+
 -- =============================================================================
 -- HELPER FUNCTIONS
 -- =============================================================================
@@ -49,7 +49,10 @@ def read_source_code(project, file_path, start_line, end_line):
     except Exception as e:
         return f"[Error reading file: {e}]"
 
-def search_by_image(image_path, top_k=3):
+# Below this many crops the single-crop path is used (batching overhead not worth it)
+BATCH_THRESHOLD = 4
+
+def search_by_image(image_path, top_k=3, batch_threshold=BATCH_THRESHOLD, batch_size=32):
     try:
         log(f"\n==================================================")
         log(f" SEARCHING BY IMAGE: {image_path}")
@@ -72,6 +75,7 @@ def search_by_image(image_path, top_k=3):
         log("      -> Libs imported. Initializing classes...")
         db = PostgresDB()
         embedder = EmbeddingService()
+        embedder.warmup()
         detector = UIComponentDetector() 
         
         # 2. Detect Candidates
@@ -102,19 +106,23 @@ def search_by_image(image_path, top_k=3):
         # 3. Process & Query
         log("\n[3/4] Generating Embeddings & Querying Database...")
         
-        for i, comp in enumerate(valid_candidates, 1):
+        # Use pre-cropped images from detector
+        crops = [c['image'] for c in valid_candidates]
+        if len(crops) >= batch_threshold:
+            log(f"      -> Batch embedding {len(crops)} crops (batch_size={batch_size})")
+            vectors = embedder.get_embeddings(crops, batch_size=batch_size)
+        else:
+            vectors = [embedder.get_embedding(crop) for crop in crops]
+        
+        # Search DB: one round trip for all crops
+        # We search for components that look like each crop (best match per component)
+        all_results = db.search_components_batch(vectors, limit=1)
+        
+        for i, (comp, vector, results) in enumerate(zip(valid_candidates, vectors, all_results), 1):
             x, y, w, h = comp['bbox'] # consistent unpacking
-            crop = comp['image'] # Use pre-cropped image from detector
-            
-            # Get embedding for this crop
-            vector = embedder.get_embedding(crop)
             
             if vector is None:
                 continue
-                
-            # Search DB
-            # We search for components that look like this crop
-            results = db.search_components(vector, limit=1) # Just get the best match per component
             
             if results:
                 best = results[0]
@@ -154,12 +162,21 @@ def search_by_image(image_path, top_k=3):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python search_by_image.py <path_to_image.png>")
+    import argparse
+    
+    parser = argparse.ArgumentParser(usage="python search_by_image.py <path_to_image.png> [--batch-threshold N]")
+    parser.add_argument("image", nargs="?", help="Path to query image")
+    parser.add_argument("--batch-threshold", type=int, default=BATCH_THRESHOLD,
+                        help="Min number of crops to use batched embedding")
+    parser.add_argument("--batch-size", type=int, default=32, help="Crops per encode_image call")
+    args = parser.parse_args()
+    
+    if not args.image:
+        parser.print_usage()
         # Default test
         test_img = "dataset/project_013_amazon/images/image1.png"
         if os.path.exists(test_img):
-            search_by_image(test_img)
+            search_by_image(test_img, batch_threshold=args.batch_threshold, batch_size=args.batch_size)
     else:
-        search_by_image(sys.argv[1])
+        search_by_image(args.image, batch_threshold=args.batch_threshold, batch_size=args.batch_size)
  
\ No newline at end of file
@@ -1,6 +1,8 @@
 
 import cv2
+import hashlib
 import numpy as np
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Dict, Tuple
 
@@ -9,21 +11,40 @@ class UIComponentDetector:
     Phát hiện các thành phần UI trong screenshot
     - rule_based: Phân chia cứng theo tỷ lệ (nhanh, không cần GPU)
     - sam: Tự động phát hiện mọi object bằng AI (chính xác, cần GPU)
+    - layout: Phân tích layout (dải màu nền, XY-cut, edge components) - ~vài chục ms/ảnh trên CPU
     """
     
-    def __init__(self, method='sam', sam_model_type='vit_b', classify_semantics=False, use_clip=False):
+    def __init__(self, method='sam', sam_model_type='vit_b', classify_semantics=False, use_clip=False,
+                 sam_max_side=None, sam_crop_n_layers=1, sam_cache_size=8, nms_backend='numpy',
+                 sam_output_mode='uncompressed_rle'):
         """
         Args:
-            method: 'rule_based' hoặc 'sam' (recommended)
+            method: 'rule_based' | 'sam' (recommended) | 'layout' (CPU-only, không cần model)
             sam_model_type: 'vit_b' (default, 375MB) | 'vit_l' (1.2GB) | 'vit_h' (2.4GB)
             classify_semantics: Enable semantic classification (header, hero, CTA, etc.)
             use_clip: Use CLIP for semantic classification (requires CLIP installed)
+            sam_max_side: Downscale ảnh sao cho cạnh dài <= giá trị này trước khi chạy SAM
+                          (None = full resolution, mặc định: mask/bbox giống dữ liệu đã index).
+                          Bbox được map lại toạ độ ảnh gốc.
+            sam_crop_n_layers: Số tầng crop của SamAutomaticMaskGenerator (0 = chỉ ảnh toàn bộ,
+                               mỗi tầng thêm nhiều lần chạy image encoder)
+            sam_cache_size: Số image embedding (output của encoder) giữ lại, key = hash ảnh.
+                            Detect lại cùng ảnh với threshold khác sẽ bỏ qua encoder. 0 = tắt.
+            nms_backend: 'numpy' (default) | 'cv2' (cv2.dnn.NMSBoxes) | 'torchvision' (ops.nms)
+            sam_output_mode: 'uncompressed_rle' (default: bộ nhớ không tăng theo số mask × số pixel,
+                             chỉ decode vùng bbox khi crop) | 'binary_mask' (HxW bool mỗi mask)
         """
         self.method = method
         self.sam_model = None
         self.mask_generator = None
         self.classify_semantics = classify_semantics
         self.semantic_classifier = None
+        self.sam_max_side = sam_max_side
+        self.sam_crop_n_layers = sam_crop_n_layers
+        self.sam_cache_size = sam_cache_size
+        self.embedding_cache_hits = 0
+        self.nms_backend = nms_backend
+        self.sam_output_mode = sam_output_mode
         
         if method == 'sam':
             self._init_sam(sam_model_type)
@@ -39,6 +60,14 @@ class UIComponentDetector:
         self.footer_ratio = 0.10
         self.min_card_width = 100
         self.min_card_height = 100
+        
+        # Thresholds cho layout detection (theo ảnh gốc, trừ layout_max_side)
+        self.layout_max_side = 800      # Phân tích trên ảnh thu nhỏ
+        self.layout_color_tol = 24      # Chênh lệch màu (tổng 3 kênh) coi là khác nền
+        self.layout_min_band_ratio = 0.03
+        self.layout_min_gap_ratio = 0.012
+        self.layout_max_depth = 4
+        self.layout_min_side = 32
     
     def _init_sam(self, model_type):
         """Initialize SAM (Segment Anything Model)"""
@@ -78,11 +107,15 @@ class UIComponentDetector:
                 points_per_side=16,  # Grid resolution (OPTIMIZED: 32→16 for 2x speed)
                 pred_iou_thresh=0.80,  # Higher = fewer but better masks
                 stability_score_thresh=0.88,  # Higher = more stable regions
-                crop_n_layers=1,
+                crop_n_layers=self.sam_crop_n_layers,
                 crop_n_points_downscale_factor=2,
                 min_mask_region_area=200,  # Skip text & small icons (was 50)
+                output_mode=self.sam_output_mode,
             )
             
+            if self.sam_cache_size:
+                self._enable_embedding_cache(self.sam_cache_size)
+            
             print(f"[INFO] SAM loaded successfully!")
             
         except ImportError:
@@ -90,7 +123,95 @@ class UIComponentDetector:
             print("Install: pip install git+https://github.com/facebookresearch/segment-anything.git")
             raise
     
+    
+    def _enable_embedding_cache(self, cache_size):
+        """
+        Bọc predictor.set_image bằng LRU cache (key = hash nội dung ảnh)
+        
+        SamAutomaticMaskGenerator gọi set_image cho ảnh và từng crop; image encoder
+        (ViT) là phần tốn nhất. Ảnh đã gặp thì chỉ khôi phục features đã lưu.
+        """
+        predictor = self.mask_generator.predictor
+        original_set_image = predictor.set_image
+        cache = OrderedDict()
+        
+        def set_image(image, image_format="RGB"):
+            image = np.ascontiguousarray(image)
+            key = (hashlib.sha1(image.tobytes()).hexdigest(), image.shape, image_format)
+            
+            cached = cache.get(key)
+            if cached is not None:
+                cache.move_to_end(key)
+                predictor.reset_image()
+                predictor.features, predictor.original_size, predictor.input_size = cached
+                predictor.is_image_set = True
+                self.embedding_cache_hits += 1
+                return
+            
+            original_set_image(image, image_format)
+            cache[key] = (predictor.features, predictor.original_size, predictor.input_size)
+            if len(cache) > cache_size:
+                cache.popitem(last=False)
+        
+        predictor.set_image = set_image
+        self._embedding_cache = cache
+    
+    def _sam_scale(self, h, w):
+        """Hệ số downscale cho SAM (<= 1.0)"""
+        if not self.sam_max_side or max(h, w) <= self.sam_max_side:
+            return 1.0
+        return self.sam_max_side / max(h, w)
+    
+    @staticmethod
+    def _scale_bbox(bbox, scale, img_w, img_h):
+        """Bbox [x, y, w, h] trên ảnh đã downscale -> toạ độ ảnh gốc (clamp trong ảnh)"""
+        x, y, w_box, h_box = bbox
+        if scale == 1.0:
+            return [int(x), int(y), int(w_box), int(h_box)]
+        x0 = min(int(round(x / scale)), img_w - 1)
+        y0 = min(int(round(y / scale)), img_h - 1)
+        x1 = min(int(round((x + w_box) / scale)), img_w)
+        y1 = min(int(round((y + h_box) / scale)), img_h)
+        return [x0, y0, max(1, x1 - x0), max(1, y1 - y0)]
+    
+    @staticmethod
+    def _mask_region(mask, sam_bbox, size, scale):
+        """
+        Phần mask nằm trong bbox, ở độ phân giải ảnh gốc
         
+        Args:
+            mask: HxW bool mask hoặc uncompressed RLE {'size', 'counts'} (độ phân giải SAM)
+            sam_bbox: bbox [x, y, w, h] trên ảnh SAM
+            size: (w, h) của bbox trên ảnh gốc
+        """
+        x, y, w_box, h_box = [int(v) for v in sam_bbox]
+        if isinstance(mask, dict):
+            region = UIComponentDetector._rle_region(mask, x, y, w_box, h_box)
+        else:
+            region = mask[y:y+h_box, x:x+w_box]
+        if scale == 1.0:
+            return region
+        region = cv2.resize(region.astype(np.uint8), size, interpolation=cv2.INTER_NEAREST)
+        return region.astype(bool)
+    
+    @staticmethod
+    def _rle_region(rle, x, y, w_box, h_box):
+        """
+        Decode một vùng bbox của uncompressed RLE (column-major, run đầu tiên là 0)
+        Chỉ decode các cột x..x+w_box thay vì cả mask HxW
+        """
+        h = rle['size'][0]
+        counts = np.asarray(rle['counts'], dtype=np.int64)
+        ends = np.cumsum(counts)
+        starts = ends - counts
+        values = (np.arange(len(counts)) % 2).astype(bool)
+        
+        lo, hi = x * h, (x + w_box) * h
+        sel = (ends > lo) & (starts < hi)
+        lengths = np.minimum(ends[sel], hi) - np.maximum(starts[sel], lo)
+        cols = np.repeat(values[sel], lengths).reshape(w_box, h)
+        return cols.T[y:y+h_box]
+    
     def detect(self, image_path: str) -> List[Dict]:
         """
         Phát hiện components trong một ảnh
@@ -116,6 +237,8 @@ class UIComponentDetector:
             return self._detect_rule_based(img)
         elif self.method == 'sam':
             return self._detect_sam(img)
+        elif self.method == 'layout':
+            return self._detect_layout(img)
         else:
             raise ValueError(f"Unknown method: {self.method}")
     
@@ -129,62 +252,63 @@ class UIComponentDetector:
         h, w = img.shape[:2]
         components = []
         
+        # Downscale trước khi chạy SAM (encoder chạy trên ảnh nhỏ hơn)
+        scale = self._sam_scale(h, w)
+        if scale < 1.0:
+            sam_img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                 interpolation=cv2.INTER_AREA)
+        else:
+            sam_img = img
+        
         # Generate masks automatically
-        print(f"[INFO] Running SAM inference...")
-        masks = self.mask_generator.generate(img)
+        print(f"[INFO] Running SAM inference on {sam_img.shape[1]}x{sam_img.shape[0]} "
+              f"(crop layers: {self.sam_crop_n_layers})...")
+        masks = self.mask_generator.generate(sam_img)
+        
+        # Bbox về toạ độ ảnh gốc
+        for m in masks:
+            m['bbox_orig'] = self._scale_bbox(m['bbox'], scale, w, h)
         
         # OPTIMIZATION: Early size filtering (remove tiny/huge masks)
         img_area = h * w
         original_count = len(masks)
         masks = [m for m in masks if 
-                 0.001 < (m['bbox'][2] * m['bbox'][3]) / img_area < 0.5]
+                 0.001 < (m['bbox_orig'][2] * m['bbox_orig'][3]) / img_area < 0.5]
         
         print(f"[INFO] SAM detected {original_count} objects ({len(masks)} after size filter)")
         
-        # Convert masks to components
-        for idx, mask_data in enumerate(masks):
-            # Extract segmentation mask
-            mask = mask_data['segmentation']  # Boolean array
-            
-            # Get bounding box
-            bbox_xywh = mask_data['bbox']  # [x, y, w, h]
-            x, y, w_box, h_box = [int(v) for v in bbox_xywh]
+        # Components chỉ với bbox/confidence; mask giữ tham chiếu, chưa crop
+        for mask_data in masks:
+            x, y, w_box, h_box = mask_data['bbox_orig']  # [x, y, w, h] toạ độ ảnh gốc
             
-            # Crop component using mask
-            try:
-                # Create empty crop
-                crop = np.zeros((h_box, w_box, 3), dtype=np.uint8)
-                
-                # Extract region
-                region = img[y:y+h_box, x:x+w_box]
-                region_mask = mask[y:y+h_box, x:x+w_box]
-                
-                # Apply mask
-                crop[region_mask] = region[region_mask]
-                
-                # Classify component type based on position
-                comp_type = self._classify_component_type(y, h, w_box, h_box)
-                
-                components.append({
-                    'type': comp_type,
-                    'bbox': [x, y, w_box, h_box],
-                    'bbox_norm': [
-                        x / w,
-                        y / h,
-                        w_box / w,
-                        h_box / h
-                    ],
-                    'image': crop,
-                    'confidence': float(mask_data.get('predicted_iou', 0.0))
-                })
-                
-            except Exception as e:
-                print(f"[WARN] Failed to process mask {idx}: {e}")
-                continue
+            components.append({
+                'type': self._classify_component_type(y, h, w_box, h_box),
+                'bbox': [x, y, w_box, h_box],
+                'bbox_norm': [
+                    x / w,
+                    y / h,
+                    w_box / w,
+                    h_box / h
+                ],
+                'confidence': float(mask_data.get('predicted_iou', 0.0)),
+                '_mask': mask_data
+            })
+        masks = None
         
-        # Post-processing: Filter và clean up
+        # Post-processing: Filter và clean up (area, aspect, confidence, NMS trên bbox)
         print(f"[INFO] Filtering components...")
         components = self._filter_components(components, img.shape)
+        
+        # Chỉ crop (áp mask) cho components còn lại
+        survivors = []
+        for idx, comp in enumerate(components):
+            mask_data = comp.pop('_mask')
+            try:
+                comp['image'] = self._masked_crop(img, mask_data, scale)
+                survivors.append(comp)
+            except Exception as e:
+                print(f"[WARN] Failed to process mask {idx}: {e}")
+        components = survivors
         print(f"[INFO] After filtering: {len(components)} elements detected")
         
         # ENABLED: Hierarchical grouping (user wants main sections only)
@@ -205,6 +329,16 @@ class UIComponentDetector:
         
         return components
     
+    def _masked_crop(self, img: np.ndarray, mask_data: Dict, scale: float) -> np.ndarray:
+        """Crop bbox của mask trên ảnh gốc, pixel ngoài mask = 0"""
+        x, y, w_box, h_box = mask_data['bbox_orig']
+        
+        crop = np.zeros((h_box, w_box, 3), dtype=np.uint8)
+        region = img[y:y+h_box, x:x+w_box]
+        region_mask = self._mask_region(mask_data['segmentation'], mask_data['bbox'], (w_box, h_box), scale)
+        crop[region_mask] = region[region_mask]
+        return crop
+    
     def _filter_components(self, components: List[Dict], img_shape) -> List[Dict]:
         """
         Lọc và làm sạch components để loại bỏ nhiễu
@@ -252,32 +386,76 @@ class UIComponentDetector:
         
         return filtered
     
-    def _non_max_suppression(self, components: List[Dict], iou_threshold=0.5) -> List[Dict]:
+    def _non_max_suppression(self, components: List[Dict], iou_threshold=0.5,
+                             backend=None) -> List[Dict]:
         """
         Loại bỏ các boxes trùng lặp/overlap nhiều
+        
+        Greedy NMS theo confidence giảm dần: box bị loại nếu IoU > iou_threshold với
+        một box đã giữ. Kết quả theo thứ tự confidence giảm dần.
+        
+        Args:
+            backend: 'numpy' | 'cv2' | 'torchvision' (None = self.nms_backend)
         """
         if not components:
             return []
         
-        # Sort by confidence descending
-        components = sorted(components, key=lambda c: c.get('confidence', 0), reverse=True)
+        boxes = np.array([c['bbox'] for c in components], dtype=np.float64).reshape(-1, 4)
+        scores = np.array([c.get('confidence', 0) for c in components], dtype=np.float64)
         
-        keep = []
+        keep = self._nms_indices(boxes, scores, iou_threshold, backend or self.nms_backend)
+        return [components[i] for i in keep]
+    
+    @staticmethod
+    def _nms_indices(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float,
+                     backend='numpy') -> np.ndarray:
+        """
+        Chỉ số các box được giữ (thứ tự score giảm dần, score bằng nhau giữ thứ tự gốc)
         
-        for comp in components:
-            # Check overlap với các boxes đã giữ lại
-            should_keep = True
+        Args:
+            boxes: (N, 4) [x, y, width, height]
+            scores: (N,)
+        """
+        if len(boxes) == 0:
+            return np.empty(0, dtype=np.int64)
+        
+        if backend == 'cv2':
+            # NMSBoxes bỏ box có score <= score_threshold (phải >= 0): dịch score lên > 0
+            shifted = scores - scores.min() + 1.0
+            keep = cv2.dnn.NMSBoxes(boxes.tolist(), shifted.tolist(),
+                                    score_threshold=0.0, nms_threshold=iou_threshold)
+            return np.asarray(keep, dtype=np.int64).reshape(-1)
+        
+        if backend == 'torchvision':
+            import torch
+            from torchvision.ops import nms
+            xyxy = torch.from_numpy(np.concatenate([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]], axis=1))
+            return nms(xyxy, torch.from_numpy(scores), iou_threshold).numpy()
+        
+        if backend != 'numpy':
+            raise ValueError(f"Unknown NMS backend: {backend}")
+        
+        x1, y1 = boxes[:, 0], boxes[:, 1]
+        x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+        areas = boxes[:, 2] * boxes[:, 3]
+        
+        # Stable sort giống sorted(..., reverse=True) trước đây
+        order = np.argsort(-scores, kind='stable')
+        keep = []
+        while order.size:
+            i = order[0]
+            keep.append(i)
+            rest = order[1:]
             
-            for kept_comp in keep:
-                iou = self._calculate_iou(comp['bbox'], kept_comp['bbox'])
-                if iou > iou_threshold:
-                    should_keep = False
-                    break
+            # IoU của box i với mọi box còn lại (cùng công thức với _calculate_iou)
+            iw = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+            ih = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+            inter = iw * ih
+            iou = inter / (areas[i] + areas[rest] - inter + 1e-6)
             
-            if should_keep:
-                keep.append(comp)
+            order = rest[iou <= iou_threshold]
         
-        return keep
+        return np.array(keep, dtype=np.int64)
     
     def _calculate_iou(self, box1, box2):
         """
@@ -377,6 +555,9 @@ class UIComponentDetector:
     def _cluster_components(self, components: List[Dict], img_width, img_height) -> List[Dict]:
         """
         Cluster components thành groups dựa trên khoảng cách spatial
+        
+        Single-linkage trên tâm bbox: hai component cùng nhóm nếu nối được bằng chuỗi
+        các cặp có khoảng cách tâm < distance_threshold (connected components, union-find).
         """
         if not components:
             return []
@@ -384,73 +565,68 @@ class UIComponentDetector:
         # Tăng distance threshold để gom nhóm mạnh tay hơn (25% chiều cao ảnh)
         distance_threshold = img_height * 0.25
         
-        # Simple agglomerative clustering
-        clusters = [[comp] for comp in components]
+        boxes = np.array([c['bbox'] for c in components], dtype=np.float64).reshape(-1, 4)
+        centers = boxes[:, :2] + boxes[:, 2:] / 2
         
-        merged = True
-        while merged:
-            merged = False
-            new_clusters = []
-            used = set()
-            
-            for i, cluster1 in enumerate(clusters):
-                if i in used:
-                    continue
-                
-                # Try to merge with other clusters
-                for j, cluster2 in enumerate(clusters):
-                    if i >= j or j in used:
-                        continue
-                    
-                    # Calculate distance between cluster centroids
-                    dist = self._cluster_distance(cluster1, cluster2)
-                    
-                    if dist < distance_threshold:
-                        # Merge clusters
-                        cluster1.extend(cluster2)
-                        used.add(j)
-                        merged = True
-                
-                new_clusters.append(cluster1)
-                used.add(i)
-            
-            clusters = new_clusters
-            
-            if not merged:
-                break
+        labels = self._union_find(len(components), self._close_pairs(centers, distance_threshold))
+        
+        # Cluster theo thứ tự member nhỏ nhất, member theo thứ tự gốc
+        clusters = {}
+        for i, label in enumerate(labels):
+            clusters.setdefault(label, []).append(components[i])
         
         # Convert clusters to merged components
         sections = []
-        for cluster in clusters:
+        for cluster in clusters.values():
             merged_comp = self._merge_components(cluster, 'card', img_width, img_height)
             sections.append(merged_comp)
         
         return sections
     
-    def _cluster_distance(self, cluster1: List[Dict], cluster2: List[Dict]) -> float:
+    @staticmethod
+    def _close_pairs(centers: np.ndarray, threshold: float) -> np.ndarray:
         """
-        Calculate distance between two clusters (min distance between any two points)
+        Các cặp (i, j) có khoảng cách Euclid < threshold (strict)
+        KD-tree radius query nếu có scipy, không thì sort-and-sweep theo trục x
         """
-        min_dist = float('inf')
-        
-        for c1 in cluster1:
-            for c2 in cluster2:
-                dist = self._component_distance(c1, c2)
-                min_dist = min(min_dist, dist)
-        
-        return min_dist
+        n = len(centers)
+        try:
+            from scipy.spatial import cKDTree
+            pairs = cKDTree(centers).query_pairs(threshold, output_type='ndarray')
+        except ImportError:
+            order = np.argsort(centers[:, 0], kind='stable')
+            xs = centers[order, 0]
+            # Với mỗi điểm: các điểm sau nó có x trong [x, x + threshold]
+            ends = np.searchsorted(xs, xs + threshold, side='right')
+            chunks = [np.stack([np.full(e - k - 1, order[k]), order[k + 1:e]], axis=1)
+                      for k, e in enumerate(ends) if e - k > 1]
+            pairs = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+        
+        if len(pairs) == 0 or n < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        
+        # query_pairs là <= threshold: lọc lại đúng điều kiện < như trước
+        diff = centers[pairs[:, 0]] - centers[pairs[:, 1]]
+        dist = (diff[:, 0] ** 2 + diff[:, 1] ** 2) ** 0.5
+        return pairs[dist < threshold]
     
-    def _component_distance(self, comp1: Dict, comp2: Dict) -> float:
-        """
-        Euclidean distance between component centers
-        """
-        x1, y1, w1, h1 = comp1['bbox']
-        x2, y2, w2, h2 = comp2['bbox']
-        
-        cx1, cy1 = x1 + w1/2, y1 + h1/2
-        cx2, cy2 = x2 + w2/2, y2 + h2/2
-        
-        return ((cx1 - cx2)**2 + (cy1 - cy2)**2)**0.5
+    @staticmethod
+    def _union_find(n: int, pairs: np.ndarray) -> List[int]:
+        """Nhãn connected component (root) cho từng phần tử"""
+        parent = list(range(n))
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for i, j in pairs.tolist():
+            ri, rj = find(i), find(j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+        
+        return [find(i) for i in range(n)]
     
     def _merge_components(self, components: List[Dict], section_type: str, img_w=None, img_h=None) -> Dict:
         """
@@ -562,6 +738,179 @@ class UIComponentDetector:
         
         return components
     
+    def _detect_layout(self, img: np.ndarray) -> List[Dict]:
+        """
+        Layout-based detection (OpenCV/numpy, không cần GPU):
+        1. Dải màu nền (background bands) -> các section full-width
+        2. Recursive XY-cut trên projection profile của khoảng trắng trong từng band
+        3. Connected components trên edge map -> cards có viền
+        """
+        h, w = img.shape[:2]
+        
+        # Phân tích trên ảnh thu nhỏ, bbox map lại ảnh gốc
+        scale = min(1.0, self.layout_max_side / max(h, w))
+        small = img if scale == 1.0 else cv2.resize(
+            img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        sh, sw = small.shape[:2]
+        
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        edges = cv2.Canny(gray, 50, 150)
+        
+        boxes = []  # (x, y, w, h, confidence) trên ảnh thu nhỏ
+        
+        # 1. Background bands
+        bands = self._background_bands(small)
+        if len(bands) > 1:
+            for y0, y1, _ in bands:
+                boxes.append((0, y0, sw, y1 - y0, 0.95))
+        
+        # 2. XY-cut: "ink" = khác màu nền của band hoặc là edge
+        min_gap = max(3, int(round(sh * self.layout_min_gap_ratio)))
+        for y0, y1, bg in bands:
+            band = small[y0:y1].astype(np.int16)
+            ink = (np.abs(band - bg).sum(axis=2) > self.layout_color_tol) | (edges[y0:y1] > 0)
+            leaves = []
+            self._xy_cut(ink, 0, 0, sw, y1 - y0, 0, min_gap, leaves)
+            for x, y, bw, bh, conf in leaves:
+                boxes.append((x, y + y0, bw, bh, conf))
+        
+        # 3. Edge connected components
+        boxes.extend(self._edge_components(edges, scale))
+        
+        # Về toạ độ ảnh gốc + crop
+        min_side = self.layout_min_side
+        components = []
+        for x, y, bw, bh, conf in boxes:
+            x0, y0 = int(x / scale), int(y / scale)
+            x1, y1 = min(w, int(round((x + bw) / scale))), min(h, int(round((y + bh) / scale)))
+            cw, ch = x1 - x0, y1 - y0
+            if cw < min_side or ch < min_side or cw * ch > 0.95 * h * w:
+                continue
+            
+            components.append({
+                'type': self._classify_component_type(y0, h, cw, ch),
+                'bbox': [x0, y0, cw, ch],
+                'bbox_norm': [x0 / w, y0 / h, cw / w, ch / h],
+                'image': img[y0:y1, x0:x1],
+                'confidence': float(conf)
+            })
+        
+        components = self._non_max_suppression(components, iou_threshold=0.7)
+        components.sort(key=lambda c: (c['bbox'][1], c['bbox'][0]))
+        return components
+    
+    def _background_bands(self, img: np.ndarray) -> List[Tuple[int, int, np.ndarray]]:
+        """
+        Chia ảnh theo chiều dọc thành các dải có cùng màu nền
+        
+        Màu nền của mỗi hàng = median màu của hàng. Một band mới bắt đầu khi màu nền
+        đổi (> layout_color_tol) liên tục ít nhất min_band hàng.
+        
+        Returns:
+            [(y0, y1, bg_color)] phủ toàn bộ chiều cao ảnh
+        """
+        h = img.shape[0]
+        row_bg = np.median(img, axis=1).astype(np.int16)  # (h, 3)
+        min_band = max(2, int(h * self.layout_min_band_ratio))
+        
+        bands = []
+        start, color = 0, row_bg[0]
+        y = 1
+        while y < h:
+            if np.abs(row_bg[y] - color).sum() <= self.layout_color_tol:
+                y += 1
+                continue
+            # Màu mới phải giữ ổn định đủ min_band hàng
+            end = min(h, y + min_band)
+            diff = np.abs(row_bg[y:end] - row_bg[y]).sum(axis=1) <= self.layout_color_tol
+            if end - y == min_band and diff.all():
+                bands.append((start, y, color))
+                start, color = y, row_bg[y]
+                y = end
+            else:
+                y += 1
+        bands.append((start, h, color))
+        
+        # Gộp band quá mỏng vào band trước
+        merged = []
+        for y0, y1, c in bands:
+            if merged and y1 - y0 < min_band:
+                merged[-1] = (merged[-1][0], y1, merged[-1][2])
+            else:
+                merged.append((y0, y1, c))
+        return merged
+    
+    def _xy_cut(self, ink: np.ndarray, x0: int, y0: int, x1: int, y1: int,
+                depth: int, min_gap: int, out: List):
+        """
+        Recursive XY-cut: cắt vùng theo khoảng trắng (hàng/cột không có ink) dài nhất
+        
+        Lá (không cắt được nữa hoặc đạt layout_max_depth) được thêm vào `out`
+        dưới dạng (x, y, w, h, confidence).
+        """
+        region = ink[y0:y1, x0:x1]
+        rows = np.flatnonzero(region.any(axis=1))
+        cols = np.flatnonzero(region.any(axis=0))
+        if len(rows) == 0:
+            return
+        
+        # Thu gọn về bounding box của ink
+        x0, x1 = x0 + cols[0], x0 + cols[-1] + 1
+        y0, y1 = y0 + rows[0], y0 + rows[-1] + 1
+        region = ink[y0:y1, x0:x1]
+        
+        if depth < self.layout_max_depth:
+            best = None
+            for axis in (1, 0):  # 1: cắt ngang (theo hàng), 0: cắt dọc (theo cột)
+                runs = self._whitespace_runs(region.any(axis=axis), min_gap)
+                if runs and (best is None or max(b - a for a, b in runs) > best[1]):
+                    best = (axis, max(b - a for a, b in runs), runs)
+            
+            if best is not None:
+                axis, _, runs = best
+                length = region.shape[0] if axis == 1 else region.shape[1]
+                starts = [0] + [b for _, b in runs]
+                ends = [a for a, _ in runs] + [length]
+                for a, b in zip(starts, ends):
+                    if axis == 1:
+                        self._xy_cut(ink, x0, y0 + a, x1, y0 + b, depth + 1, min_gap, out)
+                    else:
+                        self._xy_cut(ink, x0 + a, y0, x0 + b, y1, depth + 1, min_gap, out)
+                return
+        
+        # Confidence: vùng càng tách biệt (cắt ở tầng nông) càng chắc là một khối
+        out.append((x0, y0, x1 - x0, y1 - y0, 0.9 - 0.025 * depth))
+    
+    @staticmethod
+    def _whitespace_runs(profile: np.ndarray, min_gap: int) -> List[Tuple[int, int]]:
+        """Các đoạn [a, b) liên tiếp không có ink, dài >= min_gap, không tính 2 đầu"""
+        empty = np.concatenate(([False], ~profile, [False])).astype(np.int8)
+        change = np.flatnonzero(np.diff(empty))
+        runs = zip(change[::2], change[1::2])
+        return [(a, b) for a, b in runs if b - a >= min_gap and a > 0 and b < len(profile)]
+    
+    def _edge_components(self, edges: np.ndarray, scale: float) -> List[Tuple]:
+        """
+        Cards có viền: connected components trên edge map đã dilate
+        Confidence theo tỉ lệ viền bbox trùng với edge (viền rõ -> gần 1)
+        """
+        h, w = edges.shape
+        dilated = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=2)
+        n, _, stats, _ = cv2.connectedComponentsWithStats(dilated, connectivity=8)
+        
+        min_w, min_h = self.min_card_width * scale, self.min_card_height * scale
+        boxes = []
+        for x, y, bw, bh, _ in stats[1:n]:
+            if bw < min_w or bh < min_h or bw * bh > 0.9 * h * w:
+                continue
+            
+            border = np.concatenate((
+                dilated[y, x:x+bw], dilated[y+bh-1, x:x+bw],
+                dilated[y:y+bh, x], dilated[y:y+bh, x+bw-1]
+            ))
+            boxes.append((x, y, bw, bh, 0.7 + 0.3 * float(np.mean(border > 0))))
+        return boxes
+    
     def _detect_cards_in_region(self, region_img: np.ndarray, y_offset: int, 
                                   img_width: int, img_height: int) -> List[Dict]:
         """
@@ -7,33 +7,42 @@ import numpy as np
 import torch
 from pathlib import Path
 
-import clip
 from PIL import Image
 
+from src.model_registry import get_clip, resolve_device, warmup
+
 
 class ComponentEmbedder:
     """
     Generate CLIP embeddings for individual UI components
     """
     
-    def __init__(self, model_name='ViT-B/32', device=None):
+    def __init__(self, model_name='ViT-B/32', device=None, precision='auto'):
         """
         Initialize CLIP model for component embedding
         
         Args:
             model_name: CLIP model variant ('ViT-B/32' produces 512-dim vectors)
             device: torch device, auto-detects if None
-        """
-        print(f"[ComponentEmbedder] Loading CLIP model: {model_name}...")
-        
-        if device is None:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        self.device = device
-        self.model, self.preprocess = clip.load(model_name, device=device)
-        self.model.eval()
+            precision: 'auto' | 'fp32' | 'fp16' (see src/model_registry.py)
         
-        print(f"[ComponentEmbedder] ✓ CLIP loaded on {device}")
+        The model itself is shared process-wide and loaded on first use.
+        """
+        self.model_name = model_name
+        self.device = resolve_device(device)
+        self.precision = precision
+    
+    @property
+    def model(self):
+        return get_clip(self.model_name, self.device, self.precision)[0]
+    
+    @property
+    def preprocess(self):
+        return get_clip(self.model_name, self.device, self.precision)[1]
+    
+    def warmup(self):
+        """Load the shared CLIP model now and run one dummy forward pass"""
+        warmup(self.model_name, self.device, self.precision)
     
     def embed_component(self, image, bbox):
         """
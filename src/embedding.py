@@ -1,33 +1,64 @@
 
 
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
 import torch
-import clip
 from PIL import Image
 from pathlib import Path
 
+from src.model_registry import get_clip, resolve_device, warmup
+
+
+def _decode_and_preprocess(preprocess, image_path):
+    """
+    Worker: đọc + preprocess 1 ảnh (module-level để chạy được trong ProcessPoolExecutor)
+    image_path có thể là đường dẫn hoặc ảnh CV2 (numpy BGR) đã decode sẵn
+    Trả về None nếu ảnh lỗi
+    """
+    try:
+        if isinstance(image_path, np.ndarray):
+            image = Image.fromarray(np.ascontiguousarray(image_path[..., ::-1]))
+        else:
+            image = Image.open(image_path).convert('RGB')
+        return preprocess(image)
+    except Exception as e:
+        name = f"ảnh {image_path.shape}" if isinstance(image_path, np.ndarray) else image_path
+        print(f"  Bỏ qua {name}: {str(e)}")
+        return None
+
 
 class ImageEmbedder:
     """
     Biến hình ảnh thành vector embedding để so sánh tương đồng
     """
     
-    def __init__(self, model_name="ViT-B/32", device=None):
+    def __init__(self, model_name="ViT-B/32", device=None, precision="auto"):
         """
-        Khởi tạo CLIP model
+        Khởi tạo CLIP model (lazy: model chỉ được load khi dùng lần đầu)
         """
-
-        if device is None:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        else:
-            self.device = device
-        
-        # Load CLIP model và preprocessing function
-        self.model, self.preprocess = clip.load(model_name, device=self.device)
-        
-        # Set model to evaluation mode
-        self.model.eval()
-        
-        print(f" Đã load model thành công!")
+        self.model_name = model_name
+        self.device = resolve_device(device)
+        self.precision = precision
+    
+    @property
+    def model(self):
+        # CLIP model dùng chung trong process (xem src/model_registry.py)
+        return get_clip(self.model_name, self.device, self.precision)[0]
+    
+    @property
+    def preprocess(self):
+        return get_clip(self.model_name, self.device, self.precision)[1]
+    
+    def warmup(self):
+        """
+        Load model ngay (thay vì lần embed đầu tiên) và chạy thử 1 forward pass
+        """
+        warmup(self.model_name, self.device, self.precision)
     
     def embed_image(self, image_path):
         """
@@ -56,6 +87,111 @@ class ImageEmbedder:
         except Exception as e:
             raise ValueError(f"Lỗi khi xử lý hình ảnh {image_path}: {str(e)}")
     
+    def load_tensor(self, image_path):
+        """
+        Đọc + preprocess 1 ảnh thành tensor (3, H, W) trên CPU
+        Không đụng tới model nên có thể chạy song song trong thread pool
+        """
+        image = Image.open(image_path).convert('RGB')
+        return self.preprocess(image)
+    
+    def embed_tensors(self, tensors):
+        """
+        Tạo embedding cho list tensor đã preprocess (1 lần encode_image)
+        Returns: numpy array (N, 512), đã normalize
+        """
+        batch_tensor = torch.stack(tensors).to(self.device)
+        
+        with torch.no_grad():
+            batch_embeddings = self.model.encode_image(batch_tensor)
+            batch_embeddings = batch_embeddings / batch_embeddings.norm(dim=-1, keepdim=True)
+        
+        return batch_embeddings.cpu().numpy()
+    
+    def iter_embeddings(self, image_paths, batch_size=32, num_workers=None,
+                        queue_size=None, use_processes=False):
+        """
+        Pipeline producer/consumer: worker decode + preprocess ảnh vào 1 queue giới hạn,
+        model lấy từng batch đầy đủ từ queue để encode
+        
+        Args:
+            image_paths: list đường dẫn ảnh (hoặc ảnh CV2 numpy BGR)
+            batch_size: số ảnh mỗi lần encode_image
+            num_workers: số worker decode (mặc định = số CPU)
+            queue_size: số ảnh tối đa đã decode chờ model (mặc định 4 * batch_size)
+            use_processes: dùng process thay vì thread để decode
+        
+        Yields:
+            (indices, embeddings) - indices là vị trí trong image_paths (ảnh lỗi bị bỏ qua),
+            embeddings là numpy array (len(indices), 512)
+        """
+        num_workers = num_workers or os.cpu_count() or 1
+        queue_size = queue_size or batch_size * 4
+        preprocess = self.preprocess
+        
+        ready = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        done = object()
+        # Lỗi của producer (vd. BrokenProcessPool) được raise lại ở consumer
+        errors = []
+        
+        def put(item):
+            # put có timeout để producer thoát được khi consumer dừng sớm
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+        
+        def producer():
+            executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            try:
+                with executor_cls(max_workers=num_workers) as pool:
+                    in_flight = deque()
+                    for idx, path in enumerate(image_paths):
+                        if stop.is_set():
+                            break
+                        in_flight.append((idx, pool.submit(_decode_and_preprocess, preprocess, path)))
+                        # Giới hạn số ảnh đang decode -> bộ nhớ không tăng theo dataset
+                        if len(in_flight) >= queue_size:
+                            i, future = in_flight.popleft()
+                            put((i, future.result()))
+                    while in_flight and not stop.is_set():
+                        i, future = in_flight.popleft()
+                        put((i, future.result()))
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                put(done)
+        
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        
+        try:
+            indices, tensors = [], []
+            while True:
+                item = ready.get()
+                if item is done:
+                    if errors:
+                        raise errors[0]
+                    break
+                idx, tensor = item
+                if tensor is None:
+                    continue
+                indices.append(idx)
+                tensors.append(tensor)
+                
+                if len(tensors) == batch_size:
+                    yield indices, self.embed_tensors(tensors)
+                    indices, tensors = [], []
+            
+            if tensors:
+                yield indices, self.embed_tensors(tensors)
+        finally:
+            stop.set()
+            thread.join()
+    
     def embed_batch(self, image_paths, batch_size=32):
         """
         Tạo embedding cho nhiều hình ảnh cùng lúc
@@ -70,9 +206,7 @@ class ImageEmbedder:
             # Load và preprocess các ảnh trong batch
             for path in batch_paths:
                 try:
-                    image = Image.open(path).convert('RGB')
-                    tensor = self.preprocess(image)
-                    batch_tensors.append(tensor)
+                    batch_tensors.append(self.load_tensor(path))
                 except Exception as e:
                     print(f"  Bỏ qua {path}: {str(e)}")
                     continue
@@ -80,15 +214,8 @@ class ImageEmbedder:
             if not batch_tensors:
                 continue
             
-            # Stack thành batch tensor
-            batch_tensor = torch.stack(batch_tensors).to(self.device)
-            
-            # Tạo embeddings
-            with torch.no_grad():
-                batch_embeddings = self.model.encode_image(batch_tensor)
-                batch_embeddings = batch_embeddings / batch_embeddings.norm(dim=-1, keepdim=True)
-            
-            embeddings.append(batch_embeddings.cpu().numpy())
+            # Stack thành batch tensor và tạo embeddings
+            embeddings.append(self.embed_tensors(batch_tensors))
         
         # Concatenate tất cả batches
         if embeddings:
@@ -3,14 +3,18 @@ import clip
 import cv2
 import numpy as np
 from PIL import Image
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
+
+from src.model_registry import get_clip, resolve_device, warmup
+from src.preprocessing import PaddedPreprocessor
 
 class EmbeddingService:
-    def __init__(self, device=None):
-        self.device = device if device else ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"[EmbeddingService] Loading CLIP on {self.device}...")
-        self.clip_model, self.clip_preprocess = clip.load("ViT-B/32", device=self.device)
-        self.clip_model.eval()
+    def __init__(self, device=None, model_name="ViT-B/32", precision="auto"):
+        self.device = resolve_device(device)
+        self.model_name = model_name
+        self.precision = precision
+        # CLIP is loaded lazily from the shared registry on first use
+        self.preprocessor = PaddedPreprocessor(target_size=224, device=self.device)
         
         # Check OCR availability
         self.ocr_available = False
@@ -24,37 +28,25 @@ class EmbeddingService:
         except Exception:
             self.ocr_available = False
 
+    @property
+    def clip_model(self):
+        return get_clip(self.model_name, self.device, self.precision)[0]
+
+    @property
+    def clip_preprocess(self):
+        return get_clip(self.model_name, self.device, self.precision)[1]
+
+    def warmup(self):
+        """Load the shared CLIP model now instead of on the first embedding call."""
+        warmup(self.model_name, self.device, self.precision)
+
     def _preprocess_with_padding(self, image: np.ndarray) -> torch.Tensor:
         """
         Pad image to square (black padding) then resize to 224x224 to preserve aspect ratio.
         Normalization matches CLIP expected mean/std.
+        Resizes before padding, so only the 224x224 target is allocated.
         """
-        target_size = 224
-        h, w = image.shape[:2]
-        
-        # 1. Pad to square
-        dim = max(h, w)
-        pad_h = (dim - h) // 2
-        pad_w = (dim - w) // 2
-        
-        # Create black canvas
-        padded = np.zeros((dim, dim, 3), dtype=np.uint8)
-        padded[pad_h:pad_h+h, pad_w:pad_w+w] = image
-        
-        # 2. Resize to 224x224
-        resized = cv2.resize(padded, (target_size, target_size))
-        
-        # 3. Convert to Tensor & Normalize
-        # CLIP expects RGB, 0-1 range, then normalized
-        img_rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
-        img_tensor = torch.from_numpy(img_rgb).permute(2, 0, 1).float() / 255.0
-        
-        # Standard CLIP mean/std
-        mean = torch.tensor([0.48145466, 0.4578275, 0.40821073], device=self.device).view(3, 1, 1)
-        std = torch.tensor([0.26862954, 0.26130258, 0.27577711], device=self.device).view(3, 1, 1)
-        
-        img_tensor = (img_tensor.to(self.device) - mean) / std
-        return img_tensor.unsqueeze(0)
+        return self.preprocessor(image)
 
     def get_embedding(self, image: np.ndarray) -> np.ndarray:
         """
@@ -79,6 +71,34 @@ class EmbeddingService:
             traceback.print_exc()
             return None
 
+    def get_embeddings(self, images: List[np.ndarray], batch_size: int = 32) -> List[np.ndarray]:
+        """
+        Batched version of get_embedding for a list of CV2 BGR crops.
+        Every crop goes through the same padding preprocess, crops are stacked
+        and encoded with one encode_image call per batch.
+        Returns: list aligned with `images` (None for empty/failed crops)
+        """
+        embeddings = [None] * len(images)
+        valid = [i for i, img in enumerate(images) if img is not None and img.size > 0]
+
+        for start in range(0, len(valid), batch_size):
+            batch_idx = valid[start:start + batch_size]
+            try:
+                batch_tensor = self.preprocessor.batch([images[i] for i in batch_idx])
+
+                with torch.no_grad():
+                    emb = self.clip_model.encode_image(batch_tensor)
+                    emb = emb / emb.norm(dim=-1, keepdim=True)
+
+                for i, vec in zip(batch_idx, emb.cpu().numpy()):
+                    embeddings[i] = vec
+            except Exception as e:
+                print(f"[EmbeddingService] Batch embedding error: {e}")
+                import traceback
+                traceback.print_exc()
+
+        return embeddings
+
     def get_text_embedding(self, text: str) -> np.ndarray:
         """
         Generate CLIP embedding for a text string.
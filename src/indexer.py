@@ -1,27 +1,164 @@
 
 import faiss
+import hashlib
+import os
+import time
 import numpy as np
 import json
 from pathlib import Path
 from tqdm import tqdm
 
+from src.metadata_store import MetadataStore
+
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.webp', '.bmp']
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-1 nội dung file (dùng để phát hiện ảnh thay đổi)"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def apply_search_params(index, params):
+    """
+    Set các tham số search (nprobe, efSearch, ...) xuyên qua các lớp bọc (IDMap, OPQ, ...)
+    """
+    space = faiss.ParameterSpace()
+    for name, value in (params or {}).items():
+        space.set_index_parameter(index, name, value)
+
 
 class ProjectIndexer:
 
     
-    def __init__(self, embedder):
+    def __init__(self, embedder, batch_size=32, num_workers=None, use_processes=False, index_params=None):
         """
         Khởi tạo ProjectIndexer
         
+        Args:
+            embedder: ImageEmbedder
+            batch_size: số ảnh mỗi lần model encode
+            num_workers: số worker decode/preprocess ảnh (mặc định = số CPU)
+            use_processes: decode bằng process pool thay vì thread pool
+            index_params: tham số index (tất cả optional):
+                train_size (100000), nlist (~4*sqrt(n)), pq_m (64), pq_nbits (8),
+                hnsw_m (32), ef_construction (40), nprobe (16), ef_search (64)
+        
+        Index là IndexIDMap2: mỗi ảnh có 1 image id ổn định (không đổi khi thêm/xoá project khác).
+        metadata[image_id] là metadata của ảnh đó (None nếu đã bị xoá).
+        manifest lưu file path -> {id, mtime, hash, project} để chỉ embed lại ảnh mới/thay đổi.
         """
         self.embedder = embedder
-        self.index = None           # FAISS index
-        self.metadata = []          # Metadata của các project/image
+        self.index = None           # FAISS index (IndexIDMap2)
+        self.metadata = []          # Metadata của các project/image, vị trí = image id
         self.dimension = 512        # Dimension của CLIP ViT-B/32
+        self.index_type = "flat"
+        self.manifest = {"next_id": 0, "files": {}}
+        # project_folder -> [tổng embedding (float64), số ảnh], cập nhật khi thêm/gỡ ảnh
+        # để dựng centroid project lúc save; None = chưa có (index cũ), dựng lại từ index
+        self.project_sums = {}
+        
+        self.batch_size = batch_size
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.use_processes = use_processes
+        self.last_throughput = 0.0  # images/sec của lần embed gần nhất
+        self.index_params = dict(index_params or {})
+    
+    def _scan_project(self, project_dir):
+        """
+        Đọc metadata.json và liệt kê ảnh của 1 project
+        
+        Returns:
+            (project_meta, image_files) hoặc (None, []) nếu project không hợp lệ
+        """
+        meta_file = project_dir / "metadata.json"
+        
+        if not meta_file.exists():
+            print(f"  Bỏ qua {project_dir.name}: không có metadata.json")
+            return None, []
+        
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                project_meta = json.load(f)
+        except Exception as e:
+            print(f"  Lỗi đọc metadata {project_dir.name}: {e}")
+            return None, []
+        
+        # Tìm tất cả ảnh trong project (bao gồm subfolder)
+        image_files_set = set()  # Dùng set để tránh duplicate
+        
+        for ext in IMAGE_EXTENSIONS:
+            # Tìm recursive trong tất cả subfolder
+            image_files_set.update(project_dir.rglob(f'*{ext}'))
+            image_files_set.update(project_dir.rglob(f'*{ext.upper()}'))
+        
+        return project_meta, sorted(image_files_set)
+    
+    def _image_metadata(self, project_meta, img_file, project_dir):
+        """Metadata lưu kèm mỗi ảnh"""
+        return {
+            **project_meta,
+            'image_path': str(img_file),
+            'image_name': img_file.name,
+            'project_folder': project_dir.name
+        }
+    
+    def _embed_files(self, image_files):
+        """
+        Tạo embedding cho list ảnh qua pipeline decode song song + encode theo batch
+        
+        Returns:
+            (ok_files, embeddings float32 (N, dim)) - bỏ qua ảnh lỗi
+        """
+        ok_files = []
+        embeddings = []
+        
+        if not image_files:
+            return ok_files, np.zeros((0, self.dimension), dtype='float32')
+        
+        start = time.perf_counter()
+        
+        with tqdm(total=len(image_files), desc="Embedding ảnh", leave=False) as pbar:
+            for indices, batch_embeddings in self.embedder.iter_embeddings(
+                    image_files,
+                    batch_size=self.batch_size,
+                    num_workers=self.num_workers,
+                    use_processes=self.use_processes):
+                ok_files.extend(image_files[i] for i in indices)
+                embeddings.append(batch_embeddings)
+                pbar.update(len(indices))
+        
+        self.last_throughput = len(ok_files) / max(time.perf_counter() - start, 1e-9)
+        
+        if not embeddings:
+            return ok_files, np.zeros((0, self.dimension), dtype='float32')
+        return ok_files, np.vstack(embeddings).astype('float32')
+    
+    def _register(self, img_file, project_meta, project_dir, mtime=None, digest=None):
+        """Cấp image id mới cho 1 ảnh và ghi vào manifest + metadata"""
+        image_id = self.manifest["next_id"]
+        self.manifest["next_id"] += 1
+        
+        self.manifest["files"][str(img_file)] = {
+            "id": image_id,
+            "mtime": mtime if mtime is not None else img_file.stat().st_mtime,
+            "hash": digest if digest is not None else file_hash(img_file),
+            "project": project_dir.name
+        }
+        
+        # metadata là list, vị trí = image id
+        self.metadata.extend([None] * (image_id + 1 - len(self.metadata)))
+        self.metadata[image_id] = self._image_metadata(project_meta, img_file, project_dir)
+        
+        return image_id
     
     def build_index(self, dataset_path, index_type="flat"):
         """
-        Scan dataset và tạo FAISS index
+        Scan dataset và tạo FAISS index (từ đầu)
         """
         dataset_path = Path(dataset_path)
         
@@ -30,123 +167,420 @@ class ProjectIndexer:
         
         print(f"\n Đang quét dataset tại: {dataset_path}")
         
-        embeddings = []
-        metadata = []
+        # Reset trạng thái
+        self.index = None
+        self.metadata = []
+        self.manifest = {"next_id": 0, "files": {}}
+        self.project_sums = {}
+        self.index_type = index_type
         
         # Lấy danh sách các thư mục project
-        project_dirs = [d for d in dataset_path.iterdir() if d.is_dir()]
+        project_dirs = sorted(d for d in dataset_path.iterdir() if d.is_dir())
         
         if not project_dirs:
             raise ValueError(f"Không tìm thấy thư mục project nào trong {dataset_path}")
         
         print(f" Tìm thấy {len(project_dirs)} thư mục project\n")
         
-        # Duyệt qua từng project
+        # Quét toàn bộ project trước, rồi embed tất cả ảnh trong 1 pipeline
+        jobs = []
         for project_dir in tqdm(project_dirs, desc="Xử lý projects"):
-            # Đọc metadata
-            meta_file = project_dir / "metadata.json"
-            
-            if not meta_file.exists():
-                print(f"  Bỏ qua {project_dir.name}: không có metadata.json")
-                continue
-            
-            try:
-                with open(meta_file, 'r', encoding='utf-8') as f:
-                    project_meta = json.load(f)
-            except Exception as e:
-                print(f"  Lỗi đọc metadata {project_dir.name}: {e}")
+            project_meta, image_files = self._scan_project(project_dir)
+            if project_meta is None:
                 continue
             
-            # Tìm tất cả ảnh trong project (bao gồm subfolder)
-            image_extensions = ['.png', '.jpg', '.jpeg', '.webp', '.bmp']
-            image_files_set = set()  # Dùng set để tránh duplicate
-            
-            for ext in image_extensions:
-                # Tìm recursive trong tất cả subfolder
-                image_files_set.update(project_dir.rglob(f'*{ext}'))
-                image_files_set.update(project_dir.rglob(f'*{ext.upper()}'))
-            
-            image_files = list(image_files_set)  # Convert set về list
-            
             if not image_files:
                 print(f"  Không tìm thấy ảnh trong {project_dir.name}")
                 continue
             
-            # Tạo embedding cho từng ảnh
-            for img_file in image_files:
-                try:
-                    # Tạo embedding
-                    emb = self.embedder.embed_image(img_file)
-                    embeddings.append(emb[0])
-                    
-                    # Lưu metadata kèm info về ảnh
-                    metadata.append({
-                        **project_meta,
-                        'image_path': str(img_file),
-                        'image_name': img_file.name,
-                        'project_folder': project_dir.name
-                    })
-                    
-                except Exception as e:
-                    print(f"  Lỗi xử lý {img_file.name}: {e}")
-                    continue
+            jobs.extend((img_file, project_meta, project_dir) for img_file in image_files)
         
-        if not embeddings:
+        # Tạo embedding (decode song song, model encode theo batch)
+        ok_files, embeddings = self._embed_files([img_file for img_file, _, _ in jobs])
+        
+        if not ok_files:
             raise ValueError("Không tạo được embedding nào! Kiểm tra lại dataset.")
         
-        # Chuyển embeddings thành numpy array
-        embeddings = np.array(embeddings).astype('float32')
+        ok = set(ok_files)
+        all_ids = [
+            self._register(img_file, project_meta, project_dir)
+            for img_file, project_meta, project_dir in jobs if img_file in ok
+        ]
         
-        print(f"\n Đã tạo {len(embeddings)} embeddings")
+        print(f"\n Đã tạo {len(embeddings)} embeddings ({self.last_throughput:.1f} images/sec)")
         
         # Tạo FAISS index
-        self._create_faiss_index(embeddings, index_type)
-        
-        # Lưu metadata
-        self.metadata = metadata
+        all_ids = np.array(all_ids, dtype='int64')
+        self._create_faiss_index(embeddings, index_type, ids=all_ids)
+        self._update_project_sums(embeddings, all_ids)
         
-        num_projects = len(set(m['project_id'] for m in metadata))
+        num_projects = len(set(m['project_id'] for m in self.metadata if m is not None))
         
         return len(embeddings), num_projects
     
-    def _create_faiss_index(self, embeddings, index_type):
+    def add_project(self, project_dir):
+        """
+        Thêm (hoặc cập nhật) 1 project vào index
+        Chỉ embed ảnh mới hoặc ảnh có nội dung thay đổi; ảnh đã bị xoá khỏi thư mục sẽ bị gỡ khỏi index.
+        
+        Returns:
+            dict {'added', 'updated', 'removed', 'unchanged'}
+        """
+        project_dir = Path(project_dir)
+        stats = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        
+        project_meta, image_files = self._scan_project(project_dir)
+        if project_meta is None:
+            return stats
+        
+        files = self.manifest["files"]
+        to_embed = []
+        stale_ids = []
+        
+        for img_file in image_files:
+            key = str(img_file)
+            entry = files.get(key)
+            mtime = img_file.stat().st_mtime
+            
+            if entry is not None:
+                # mtime không đổi -> coi như không đổi (không cần hash)
+                if entry["mtime"] == mtime:
+                    stats['unchanged'] += 1
+                    self.metadata[entry["id"]] = self._image_metadata(project_meta, img_file, project_dir)
+                    continue
+                
+                digest = file_hash(img_file)
+                if entry["hash"] == digest:
+                    entry["mtime"] = mtime
+                    stats['unchanged'] += 1
+                    self.metadata[entry["id"]] = self._image_metadata(project_meta, img_file, project_dir)
+                    continue
+                
+                # Nội dung thay đổi -> gỡ id cũ, embed lại với id mới
+                stale_ids.append(entry["id"])
+                stats['updated'] += 1
+            else:
+                digest = file_hash(img_file)
+                stats['added'] += 1
+            
+            to_embed.append((img_file, mtime, digest))
+        
+        # Ảnh có trong manifest nhưng không còn trong thư mục
+        current = {str(f) for f in image_files}
+        for key, entry in list(files.items()):
+            if entry["project"] == project_dir.name and key not in current:
+                stale_ids.append(entry["id"])
+                stats['removed'] += 1
+        
+        self._remove_ids(stale_ids)
+        
+        if to_embed:
+            ok_files, embeddings = self._embed_files([f for f, _, _ in to_embed])
+            ok = set(ok_files)
+            ids = [
+                self._register(img_file, project_meta, project_dir, mtime, digest)
+                for img_file, mtime, digest in to_embed if img_file in ok
+            ]
+            self._add_vectors(embeddings, np.array(ids, dtype='int64'))
+        
+        return stats
+    
+    def remove_project(self, project_folder):
+        """
+        Gỡ toàn bộ ảnh của 1 project (theo tên thư mục) khỏi index
+        
+        Returns:
+            Số ảnh đã gỡ
+        """
+        project_folder = Path(project_folder).name
+        ids = [e["id"] for e in self.manifest["files"].values() if e["project"] == project_folder]
+        self._remove_ids(ids)
+        return len(ids)
+    
+    def refresh(self, dataset_path):
+        """
+        Đồng bộ index với dataset: thêm project mới, embed lại ảnh thay đổi,
+        gỡ ảnh/project đã bị xoá. Ảnh không đổi không bị embed lại.
+        """
+        dataset_path = Path(dataset_path)
+        if not dataset_path.exists():
+            raise FileNotFoundError(f"Không tìm thấy dataset: {dataset_path}")
+        
+        totals = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+        project_dirs = sorted(d for d in dataset_path.iterdir() if d.is_dir())
+        
+        for project_dir in tqdm(project_dirs, desc="Refresh projects"):
+            for key, value in self.add_project(project_dir).items():
+                totals[key] += value
+        
+        # Project đã bị xoá khỏi dataset
+        existing = {d.name for d in project_dirs}
+        indexed = {e["project"] for e in self.manifest["files"].values()}
+        for project_folder in indexed - existing:
+            totals['removed'] += self.remove_project(project_folder)
+        
+        print(f" Refresh: +{totals['added']} ~{totals['updated']} "
+              f"-{totals['removed']} ={totals['unchanged']}")
+        return totals
+    
+    def _add_vectors(self, embeddings, ids):
+        """Add vectors với image id vào index (tạo index nếu chưa có)"""
+        if len(ids) == 0:
+            return
+        if self.index is None:
+            self._create_faiss_index(embeddings, self.index_type, ids=ids)
+        else:
+            if not isinstance(self.index, faiss.IndexIDMap2):
+                raise ValueError("Index cũ không hỗ trợ cập nhật incremental, hãy build_index() lại")
+            self.index.add_with_ids(embeddings, ids)
+        self._update_project_sums(embeddings, ids)
+    
+    def _update_project_sums(self, vectors, ids, sign=1):
+        """Cộng (sign=1) / trừ (sign=-1) vectors của các image id vào tổng theo project"""
+        if self.project_sums is None or len(ids) == 0:
+            return
+        
+        folders = np.array([self.metadata[int(i)]['project_folder'] for i in ids])
+        unique_folders, inverse = np.unique(folders, return_inverse=True)
+        sums = np.zeros((len(unique_folders), vectors.shape[1]), dtype='float64')
+        np.add.at(sums, inverse, vectors)
+        counts = np.bincount(inverse, minlength=len(unique_folders))
+        
+        for folder, vector_sum, count in zip(unique_folders.tolist(), sums, counts):
+            entry = self.project_sums.setdefault(folder, [np.zeros(vectors.shape[1]), 0])
+            entry[0] += sign * vector_sum
+            entry[1] += sign * int(count)
+            if entry[1] <= 0:
+                del self.project_sums[folder]
+    
+    def _remove_ids(self, ids):
+        """Gỡ image ids khỏi index, manifest và metadata"""
+        if not ids:
+            return
+        
+        remove = set(ids)
+        ids = np.array(sorted(remove), dtype='int64')
+        
+        if self.index is not None:
+            if not isinstance(self.index, faiss.IndexIDMap2):
+                raise ValueError("Index cũ không hỗ trợ cập nhật incremental, hãy build_index() lại")
+            if self.project_sums is not None:
+                try:
+                    self._update_project_sums(self.index.reconstruct_batch(ids), ids, sign=-1)
+                except RuntimeError:
+                    # Không reconstruct được -> save sẽ dựng lại centroid từ index
+                    self.project_sums = None
+            try:
+                self.index.remove_ids(ids)
+            except RuntimeError:
+                # HNSW không hỗ trợ remove -> dựng lại từ các vector còn lại
+                self._rebuild_without(remove)
+        
+        for key, entry in list(self.manifest["files"].items()):
+            if entry["id"] in remove:
+                del self.manifest["files"][key]
+        for image_id in remove:
+            if image_id < len(self.metadata):
+                self.metadata[image_id] = None
+    
+    def _rebuild_without(self, remove):
+        """
+        Dựng lại index (cùng loại) bỏ đi các ids trong `remove`
+        Dùng lại phần đã train (IVF centroids, PQ/OPQ codebooks) thay vì train lại
+        """
+        all_ids = faiss.vector_to_array(self.index.id_map)
+        keep_ids = np.array([i for i in all_ids if i not in remove], dtype='int64')
+        
+        if len(keep_ids) == 0:
+            self.index = None
+            return
+        
+        vectors = np.vstack([self.index.reconstruct(int(i)) for i in keep_ids]).astype('float32')
+        
+        base = faiss.clone_index(faiss.downcast_index(self.index.index))
+        base.reset()
+        self.index = faiss.IndexIDMap2(base)
+        self._prepare_ivf(base)
+        self.index.add_with_ids(vectors, keep_ids)
+        self.apply_search_params()
+    
+    def _prepare_ivf(self, base):
+        """
+        IVF cần direct map: để reconstruct được, và để remove_ids báo lỗi
+        (-> rebuild) thay vì làm lệch id_map của IndexIDMap2
+        """
+        try:
+            ivf = faiss.extract_index_ivf(base)
+        except RuntimeError:
+            return None
+        ivf.make_direct_map()
+        return ivf
+    
+    def _training_sample(self, embeddings):
+        """Lấy mẫu ngẫu nhiên tối đa `train_size` vectors để train"""
+        train_size = self.index_params.get('train_size', 100_000)
+        if len(embeddings) <= train_size:
+            return embeddings
+        rng = np.random.default_rng(0)
+        return embeddings[rng.choice(len(embeddings), train_size, replace=False)]
+    
+    def _factory_string(self, index_type, n_train):
+        """
+        Chuỗi index_factory cho các loại index nén
+        
+        ivfpq:      IVF + Product Quantization (pq_m bytes/vector khi pq_nbits=8)
+        opq+ivfpq:  OPQ rotation + IVF-PQ (recall tốt hơn ivfpq với cùng dung lượng)
+        sq8:        Scalar quantization 8-bit (4x nhỏ hơn float32, gần như không mất recall)
+        hnsw_sq:    HNSW graph trên vectors SQ8
+        """
+        params = self.index_params
+        
+        # nlist ~ 4*sqrt(n), nhưng mỗi cluster cần ~39 điểm train
+        nlist = params.get('nlist') or int(4 * np.sqrt(n_train))
+        nlist = max(1, min(nlist, n_train // 39))
+        pq_m = params.get('pq_m', 64)
+        # PQ cần >= 2^nbits điểm train
+        pq_nbits = min(params.get('pq_nbits', 8), max(1, int(np.log2(max(n_train, 2)))))
+        hnsw_m = params.get('hnsw_m', 32)
+        
+        if index_type == "ivfpq":
+            return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+        if index_type == "opq+ivfpq":
+            return f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{pq_nbits}"
+        if index_type == "sq8":
+            return "SQ8"
+        if index_type == "hnsw_sq":
+            return f"HNSW{hnsw_m},SQ8"
+        raise ValueError(f"Index type không hợp lệ: {index_type}")
+    
+    def _create_faiss_index(self, embeddings, index_type, ids=None):
         """
         Tạo FAISS index từ embeddings
         
+        Index được bọc trong IndexIDMap2 để dùng image id ổn định (ids) thay vì vị trí.
+        Các loại nén (ivfpq, opq+ivfpq, sq8, hnsw_sq) dùng inner product và train trên
+        tối đa index_params['train_size'] vectors.
         """
         dimension = embeddings.shape[1]
         n_vectors = embeddings.shape[0]
         
+        if ids is None:
+            ids = np.arange(n_vectors, dtype='int64')
+        
         print(f"\nĐang tạo FAISS index ({index_type})...")
         
         if index_type == "flat":
             # IndexFlatIP: Inner Product (= Cosine similarity cho normalized vectors)
             # Chính xác 100%, phù hợp cho < 1M vectors
-            self.index = faiss.IndexFlatIP(dimension)
+            base = faiss.IndexFlatIP(dimension)
             
         elif index_type == "ivf":
             # IVF: Inverted File Index (faster, approximate)
             quantizer = faiss.IndexFlatIP(dimension)
-            nlist = min(100, n_vectors // 10)  # Số clusters
-            self.index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
-            self.index.train(embeddings)
+            nlist = max(1, min(100, n_vectors // 10))  # Số clusters
+            base = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+            base.train(self._training_sample(embeddings))
             
         elif index_type == "hnsw":
             # HNSW: Hierarchical Navigable Small World (very fast)
-            self.index = faiss.IndexHNSWFlat(dimension, 32)  # 32 = M parameter
+            base = faiss.IndexHNSWFlat(dimension, self.index_params.get('hnsw_m', 32))  # M parameter
+            
+        elif index_type in ("ivfpq", "opq+ivfpq", "sq8", "hnsw_sq"):
+            train = self._training_sample(embeddings)
+            spec = self._factory_string(index_type, len(train))
+            print(f" index_factory: {spec} (train trên {len(train)} vectors)")
+            base = faiss.index_factory(dimension, spec, faiss.METRIC_INNER_PRODUCT)
+            base.train(train)
             
         else:
             raise ValueError(f"Index type không hợp lệ: {index_type}")
         
+        if index_type in ("hnsw", "hnsw_sq"):
+            faiss.downcast_index(base).hnsw.efConstruction = self.index_params.get('ef_construction', 40)
+        
+        self._prepare_ivf(base)
+        
+        self.index_type = index_type
+        self.index = faiss.IndexIDMap2(base)
+        
         # Add vectors vào index
-        self.index.add(embeddings)
+        self.index.add_with_ids(embeddings, ids)
+        
+        self.apply_search_params()
         
         print(f" Index created: {n_vectors} vectors, dimension={dimension}")
     
-    def save(self, index_path="index.faiss", meta_path="metadata.json"):
+    def search_params(self):
+        """
+        Tham số lúc search (được lưu trong manifest để ProjectSearcher áp dụng khi load)
+        """
+        params = {}
+        if self.index_type in ("ivf", "ivfpq", "opq+ivfpq"):
+            params['nprobe'] = self.index_params.get('nprobe', 16)
+        if self.index_type in ("hnsw", "hnsw_sq"):
+            params['efSearch'] = self.index_params.get('ef_search', 64)
+        return params
+    
+    def apply_search_params(self):
+        """Áp dụng nprobe / efSearch lên index hiện tại"""
+        if self.index is not None:
+            apply_search_params(self.index, self.search_params())
+    
+    def build_project_index(self, project_of):
         """
-        Lưu index và metadata ra file
+        Index cấp project (tầng 1 của tìm kiếm 2 tầng): mỗi project 1 vector centroid
+        = trung bình các embedding ảnh của nó, đã normalize
+        
+        Dùng tổng theo project (project_sums) được cập nhật trong add_project /
+        remove_project; chỉ khi chưa có (index cũ) mới reconstruct toàn bộ index.
+        
+        Args:
+            project_of: mảng image id -> project index (-1 nếu không có),
+                        xem MetadataStore.project_index_array()
         
+        Returns:
+            IndexIDMap2(IndexFlatIP) với id = project index, None nếu index rỗng
+        """
+        if self.project_sums is None:
+            self._rebuild_project_sums()
+        
+        # project_folder -> project index (cùng cách đánh số với MetadataStore)
+        folder_idx = {}
+        for image_id, meta in enumerate(self.metadata[:len(project_of)]):
+            if meta is not None and project_of[image_id] >= 0:
+                folder_idx.setdefault(meta['project_folder'], int(project_of[image_id]))
+        
+        entries = [(folder_idx[folder], vector_sum)
+                   for folder, (vector_sum, _) in self.project_sums.items() if folder in folder_idx]
+        if not entries:
+            return None
+        
+        project_ids = np.array([idx for idx, _ in entries], dtype='int64')
+        centroids = np.vstack([vector_sum for _, vector_sum in entries]).astype('float32')
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        
+        project_index = faiss.IndexIDMap2(faiss.IndexFlatIP(centroids.shape[1]))
+        project_index.add_with_ids(centroids, project_ids)
+        return project_index
+    
+    def _rebuild_project_sums(self):
+        """Tính lại project_sums bằng cách reconstruct mọi vector (index cũ chưa lưu tổng)"""
+        ids = faiss.vector_to_array(self.index.id_map)
+        ids = np.array([i for i in ids if i < len(self.metadata) and self.metadata[i] is not None],
+                       dtype='int64')
+        self.project_sums = {}
+        try:
+            if len(ids):
+                self._update_project_sums(self.index.reconstruct_batch(ids).astype('float32'), ids)
+        except RuntimeError:
+            self.project_sums = None
+            raise
+    
+    def save(self, index_path="index.faiss", meta_path="metadata.json", manifest_path=None):
+        """
+        Lưu index, metadata và manifest ra file
+        manifest mặc định nằm cạnh index: <thư mục index>/manifest.json
+        metadata store (SQLite) cho searcher nằm cạnh metadata: <meta_path>.db
         """
         if self.index is None:
             raise ValueError("Index chưa được tạo! Gọi build_index() trước.")
@@ -162,10 +596,52 @@ class ProjectIndexer:
         with open(meta_path, 'w', encoding='utf-8') as f:
             json.dump(self.metadata, f, indent=2, ensure_ascii=False)
         print(f" Đã lưu metadata: {meta_path}")
+        
+        # Metadata store gọn cho ProjectSearcher (không phải parse cả metadata.json)
+        store_path = meta_path.with_suffix('.db')
+        num_images, num_projects = MetadataStore.write(store_path, self.metadata)
+        print(f" Đã lưu metadata store: {store_path} ({num_images} ảnh, {num_projects} projects)")
+        
+        # Index centroid theo project (dùng cho ProjectSearcher.search_two_level)
+        store = MetadataStore(store_path)
+        try:
+            project_index = self.build_project_index(store.project_index_array())
+        except RuntimeError as e:
+            # Index không reconstruct được -> bỏ qua, search_two_level sẽ báo lỗi
+            print(f" Bỏ qua project index: {e}")
+            project_index = None
+        finally:
+            store.close()
+        if project_index is not None:
+            project_index_path = index_path.with_name("project_index.faiss")
+            faiss.write_index(project_index, str(project_index_path))
+            print(f" Đã lưu project index: {project_index_path} ({project_index.ntotal} projects)")
+        
+        # Tổng embedding theo project, để lần save sau không phải reconstruct cả index
+        sums_path = index_path.with_name("project_sums.npz")
+        if self.project_sums is not None:
+            folders = list(self.project_sums)
+            np.savez(sums_path,
+                     folders=np.array(folders, dtype=str),
+                     sums=np.array([self.project_sums[f][0] for f in folders]).reshape(len(folders), -1),
+                     counts=np.array([self.project_sums[f][1] for f in folders], dtype='int64'))
+        elif sums_path.exists():
+            sums_path.unlink()
+        
+        # Lưu manifest
+        manifest_path = Path(manifest_path) if manifest_path else index_path.with_name("manifest.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                **self.manifest,
+                "index_type": self.index_type,
+                "index_params": self.index_params,
+                "search_params": self.search_params()
+            }, f, indent=2, ensure_ascii=False)
+        print(f" Đã lưu manifest: {manifest_path}")
     
-    def load(self, index_path="index.faiss", meta_path="metadata.json"):
+    def load(self, index_path="index.faiss", meta_path="metadata.json", manifest_path=None):
         """
-        Load index và metadata từ file
+        Load index, metadata và manifest từ file
         """
         # Load FAISS index
         index_path = Path(index_path)
@@ -183,11 +659,37 @@ class ProjectIndexer:
         with open(meta_path, 'r', encoding='utf-8') as f:
             self.metadata = json.load(f)
         print(f" Đã load metadata: {len(self.metadata)} items")
+        
+        # Load manifest (index cũ không có manifest -> chỉ dùng để search)
+        manifest_path = Path(manifest_path) if manifest_path else index_path.with_name("manifest.json")
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.index_type = manifest.pop("index_type", self.index_type)
+            self.index_params = {**manifest.pop("index_params", {}), **self.index_params}
+            manifest.pop("search_params", None)
+            self.manifest = manifest
+            self.apply_search_params()
+            print(f" Đã load manifest: {len(self.manifest['files'])} files")
+        else:
+            self.manifest = {"next_id": len(self.metadata), "files": {}}
+            print(f" Không có manifest: {manifest_path} (cần build_index() để cập nhật incremental)")
+        
+        # Tổng embedding theo project (index cũ không có -> dựng lại lúc save)
+        sums_path = index_path.with_name("project_sums.npz")
+        if sums_path.exists():
+            with np.load(sums_path) as data:
+                self.project_sums = {
+                    folder: [vector_sum.astype('float64'), int(count)]
+                    for folder, vector_sum, count in zip(data['folders'].tolist(), data['sums'], data['counts'])
+                }
+        else:
+            self.project_sums = None
 
 
 def test_indexer():
     """Test function"""
-    from embedding import ImageEmbedder
+    from src.embedding import ImageEmbedder
     
     # Kiểm tra dataset có tồn tại không
     dataset_path = Path("dataset")
@@ -0,0 +1,221 @@
+"""
+Metadata Store - Compact, on-disk metadata for the FAISS index
+Project records are stored once; each image row only keeps its own fields plus
+the index of its project. Lookups read only the rows a search returns.
+"""
+
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+# Fields that belong to the image, everything else is project-level
+IMAGE_FIELDS = ('image_path', 'image_name', 'project_folder')
+
+# SQLite default limit on bound parameters is 999 on older builds
+_IN_CHUNK = 900
+
+
+class MetadataStore:
+    """
+    SQLite-backed metadata: `projects` (1 row per project) + `images` (1 row per image id)
+    """
+
+    def __init__(self, db_path, project_cache_size=4096):
+        db_path = Path(db_path)
+        if not db_path.exists():
+            raise FileNotFoundError(f"Không tìm thấy metadata store: {db_path}")
+
+        # Read-only; safe to share between threads of a search worker
+        self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self.project_cache_size = project_cache_size
+        self._project_cache = OrderedDict()
+        self._size = self.conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    @staticmethod
+    def write(db_path, metadata: List[Dict]):
+        """
+        Build the store from the indexer metadata list (position = image id, None = removed)
+        """
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = db_path.with_suffix(db_path.suffix + ".tmp")
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+        conn = sqlite3.connect(str(tmp_path))
+        conn.executescript("""
+            CREATE TABLE projects (
+                idx         INTEGER PRIMARY KEY,
+                project_id  TEXT,
+                data        TEXT NOT NULL
+            );
+            CREATE TABLE images (
+                id              INTEGER PRIMARY KEY,
+                project_idx     INTEGER NOT NULL,
+                image_path      TEXT,
+                image_name      TEXT,
+                project_folder  TEXT
+            );
+        """)
+
+        project_idx = {}
+        project_rows = []
+        image_rows = []
+
+        for image_id, meta in enumerate(metadata):
+            if meta is None:
+                continue
+
+            project_data = {k: v for k, v in meta.items() if k not in IMAGE_FIELDS}
+            key = (meta.get('project_folder'), meta.get('project_id'))
+            if key not in project_idx:
+                project_idx[key] = len(project_rows)
+                project_rows.append((
+                    project_idx[key],
+                    meta.get('project_id'),
+                    json.dumps(project_data, ensure_ascii=False)
+                ))
+
+            image_rows.append((
+                image_id,
+                project_idx[key],
+                meta.get('image_path'),
+                meta.get('image_name'),
+                meta.get('project_folder')
+            ))
+
+        conn.executemany("INSERT INTO projects VALUES (?, ?, ?)", project_rows)
+        conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?)", image_rows)
+        conn.commit()
+        conn.close()
+
+        os.replace(tmp_path, db_path)
+        return len(image_rows), len(project_rows)
+
+    def __len__(self):
+        return self._size
+
+    def _projects(self, idxs) -> Dict[int, Dict]:
+        """Project records by idx, with a small LRU parse cache"""
+        cache = self._project_cache
+        result = {}
+        missing = []
+        for i in idxs:
+            if i in cache:
+                cache.move_to_end(i)
+                result[i] = cache[i]
+            else:
+                missing.append(i)
+
+        for start in range(0, len(missing), _IN_CHUNK):
+            chunk = missing[start:start + _IN_CHUNK]
+            rows = self.conn.execute(
+                f"SELECT idx, data FROM projects WHERE idx IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for idx, data in rows:
+                result[idx] = cache[idx] = json.loads(data)
+
+        # Evict least recently used only after the result is complete
+        while len(cache) > self.project_cache_size:
+            cache.popitem(last=False)
+
+        return result
+
+    def get_many(self, ids) -> Dict[int, Dict]:
+        """
+        Metadata of many image ids, in the same shape as the old metadata.json entries
+
+        Returns:
+            {image_id: {**project_meta, image_path, image_name, project_folder}}
+            (ids that do not exist are left out)
+        """
+        ids = sorted({int(i) for i in ids if i >= 0})
+        rows = []
+        for start in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[start:start + _IN_CHUNK]
+            rows.extend(self.conn.execute(
+                f"SELECT id, project_idx, image_path, image_name, project_folder "
+                f"FROM images WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+
+        projects = self._projects(sorted({r[1] for r in rows}))
+
+        return {
+            image_id: {
+                **projects.get(project_idx, {}),
+                'image_path': image_path,
+                'image_name': image_name,
+                'project_folder': project_folder
+            }
+            for image_id, project_idx, image_path, image_name, project_folder in rows
+        }
+
+    def project_index_array(self) -> np.ndarray:
+        """
+        int32 array: image id -> project idx (-1 for ids without metadata)
+        4 bytes per image, used for vectorized grouping of search hits
+        """
+        max_id = self.conn.execute("SELECT COALESCE(MAX(id), -1) FROM images").fetchone()[0]
+        mapping = np.full(max_id + 1, -1, dtype=np.int32)
+        for image_id, project_idx in self.conn.execute("SELECT id, project_idx FROM images"):
+            mapping[image_id] = project_idx
+        return mapping
+
+    def close(self):
+        self.conn.close()
+
+
+class ListMetadataStore:
+    """
+    Same interface over a legacy metadata.json list (everything in RAM)
+    """
+
+    def __init__(self, metadata: List[Dict]):
+        self.metadata = metadata
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def get_many(self, ids) -> Dict[int, Dict]:
+        result = {}
+        for i in ids:
+            i = int(i)
+            if 0 <= i < len(self.metadata) and self.metadata[i] is not None:
+                result[i] = self.metadata[i]
+        return result
+
+    def project_index_array(self) -> np.ndarray:
+        # Cùng cách đánh số project như MetadataStore.write (thứ tự xuất hiện)
+        keys = {}
+        mapping = np.full(len(self.metadata), -1, dtype=np.int32)
+        for i, meta in enumerate(self.metadata):
+            if meta is not None:
+                key = (meta.get('project_folder'), meta.get('project_id'))
+                mapping[i] = keys.setdefault(key, len(keys))
+        return mapping
+
+    def close(self):
+        pass
+
+
+def open_metadata(meta_path):
+    """
+    Open the metadata for an index: `<meta_path>.db` store if present, else legacy JSON
+    """
+    meta_path = Path(meta_path)
+    db_path = meta_path if meta_path.suffix == '.db' else meta_path.with_suffix('.db')
+
+    if db_path.exists():
+        return MetadataStore(db_path)
+
+    if not meta_path.exists():
+        raise FileNotFoundError(f"Không tìm thấy metadata: {meta_path}")
+
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        return ListMetadataStore(json.load(f))
@@ -0,0 +1,106 @@
+"""
+Model Registry - Share one CLIP model per process
+Every embedder/classifier asks the registry instead of calling clip.load() itself,
+so a process holds a single copy of each (model_name, device, precision).
+"""
+
+import threading
+
+import torch
+
+
+_models = {}
+_lock = threading.Lock()
+
+
+def resolve_device(device=None):
+    """Pick cuda when available, otherwise cpu"""
+    if device is None:
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def resolve_precision(device, precision="auto"):
+    """
+    Resolve precision for a device
+
+    Args:
+        device: 'cuda' | 'cpu' | torch device string
+        precision: 'auto' | 'fp32' | 'fp16'
+            'auto' keeps clip.load() behaviour: fp16 on cuda, fp32 on cpu
+    """
+    on_cuda = str(device).startswith("cuda")
+    if precision == "auto":
+        return "fp16" if on_cuda else "fp32"
+    if precision not in ("fp32", "fp16"):
+        raise ValueError(f"Unknown precision: {precision}")
+    if precision == "fp16" and not on_cuda:
+        raise ValueError("fp16 precision requires a cuda device")
+    return precision
+
+
+def get_clip(model_name="ViT-B/32", device=None, precision="auto"):
+    """
+    Return the shared (model, preprocess) pair, loading it on first use
+
+    Args:
+        model_name: CLIP model variant ('ViT-B/32' produces 512-dim vectors)
+        device: torch device, auto-detects if None
+        precision: 'auto' | 'fp32' | 'fp16'
+
+    Returns:
+        (model, preprocess) - model is already in eval mode
+    """
+    device = resolve_device(device)
+    precision = resolve_precision(device, precision)
+    key = (model_name, device, precision)
+
+    entry = _models.get(key)
+    if entry is not None:
+        return entry
+
+    with _lock:
+        # Another thread may have loaded it while we waited
+        entry = _models.get(key)
+        if entry is not None:
+            return entry
+
+        import clip
+
+        print(f"[ModelRegistry] Loading CLIP {model_name} on {device} ({precision})...")
+        model, preprocess = clip.load(model_name, device=device)
+        model = model.half() if precision == "fp16" else model.float()
+        model.eval()
+
+        entry = (model, preprocess)
+        _models[key] = entry
+        print(f"[ModelRegistry] ✓ CLIP {model_name} ready")
+
+    return entry
+
+
+def warmup(model_name="ViT-B/32", device=None, precision="auto"):
+    """
+    Load the model now and run one dummy forward pass
+    Call this at worker startup so the first request does not pay the load cost.
+    """
+    model, _ = get_clip(model_name, device, precision)
+    device = resolve_device(device)
+    resolution = model.visual.input_resolution
+
+    with torch.no_grad():
+        dummy = torch.zeros((1, 3, resolution, resolution), device=device)
+        model.encode_image(dummy)
+
+    return model
+
+
+def loaded_models():
+    """List of (model_name, device, precision) keys currently resident"""
+    return list(_models.keys())
+
+
+def clear():
+    """Drop every cached model (mainly for tests / freeing GPU memory)"""
+    with _lock:
+        _models.clear()
@@ -0,0 +1,79 @@
+"""
+Padding Preprocessor - Aspect-preserving CLIP preprocessing for UI crops
+Resizes the crop first and pads afterwards, so only the target-size canvas is
+allocated (a 1920x80 header never becomes a 1920x1920 canvas).
+"""
+
+import cv2
+import numpy as np
+import torch
+from typing import List
+
+# Standard CLIP mean/std (RGB)
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+class PaddedPreprocessor:
+    """
+    Letterbox a CV2 BGR image into a black square, then normalize for CLIP
+    """
+
+    def __init__(self, target_size=224, device="cpu"):
+        self.target_size = target_size
+        self.device = device
+
+        # Cached once instead of being rebuilt on every call
+        self.mean = torch.tensor(CLIP_MEAN, device=device).view(1, 3, 1, 1)
+        self.std = torch.tensor(CLIP_STD, device=device).view(1, 3, 1, 1)
+
+    def _letterbox_into(self, image: np.ndarray, canvas: np.ndarray):
+        """
+        Resize `image` to fit target_size and write it (as RGB) centered into `canvas`
+
+        Args:
+            image: HxWx3 BGR uint8
+            canvas: target_size x target_size x 3 uint8, already zeroed
+        """
+        size = self.target_size
+        h, w = image.shape[:2]
+        dim = max(h, w)
+        scale = size / dim
+
+        # Same geometry as padding to a dim x dim square then resizing to size
+        new_w = min(size, max(1, int(round(w * scale))))
+        new_h = min(size, max(1, int(round(h * scale))))
+        off_x = (size - new_w) // 2
+        off_y = (size - new_h) // 2
+
+        resized = cv2.resize(image, (new_w, new_h))
+        # BGR -> RGB while copying into the canvas
+        canvas[off_y:off_y + new_h, off_x:off_x + new_w] = resized[..., ::-1]
+
+    def _normalize(self, batch_uint8: np.ndarray) -> torch.Tensor:
+        """(N,H,W,3) uint8 RGB -> preallocated (N,3,H,W) normalized float tensor"""
+        n = batch_uint8.shape[0]
+        out = torch.empty((n, 3, self.target_size, self.target_size),
+                          dtype=torch.float32, device=self.device)
+        out.copy_(torch.from_numpy(batch_uint8).permute(0, 3, 1, 2))
+        out.div_(255.0).sub_(self.mean).div_(self.std)
+        return out
+
+    def __call__(self, image: np.ndarray) -> torch.Tensor:
+        """
+        Preprocess one CV2 BGR image
+        Returns: (1, 3, target_size, target_size) tensor on self.device
+        """
+        return self.batch([image])
+
+    def batch(self, images: List[np.ndarray]) -> torch.Tensor:
+        """
+        Preprocess many CV2 BGR images into one (N, 3, target_size, target_size) tensor
+        """
+        size = self.target_size
+        canvas = np.zeros((len(images), size, size, 3), dtype=np.uint8)
+
+        for i, image in enumerate(images):
+            self._letterbox_into(image, canvas[i])
+
+        return self._normalize(canvas)
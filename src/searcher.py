@@ -2,9 +2,38 @@
 
 import faiss
 import json
+import numpy as np
 from pathlib import Path
 from collections import defaultdict
 
+from src.indexer import apply_search_params
+from src.metadata_store import open_metadata
+
+
+AGGREGATIONS = ("max", "mean_topm", "softmax_sum")
+
+
+def aggregate_scores(scores, method="max", top_m=3, temperature=0.05):
+    """
+    Gộp điểm các ảnh của 1 project thành điểm project
+    
+    Args:
+        scores: numpy array điểm similarity của các ảnh
+        method: 'max' | 'mean_topm' (trung bình top_m ảnh) |
+                'softmax_sum' (temperature * logsumexp(scores / temperature),
+                thưởng project có nhiều ảnh khớp)
+    """
+    if method == "max":
+        return float(scores.max())
+    if method == "mean_topm":
+        m = min(top_m, len(scores))
+        return float(np.partition(scores, len(scores) - m)[-m:].mean())
+    if method == "softmax_sum":
+        scaled = scores / temperature
+        peak = scaled.max()
+        return float(temperature * (peak + np.log(np.exp(scaled - peak).sum())))
+    raise ValueError(f"Aggregation không hợp lệ: {method} (chọn 1 trong {AGGREGATIONS})")
+
 
 class ProjectSearcher:
     """
@@ -12,11 +41,15 @@ class ProjectSearcher:
     
     """
     
-    def __init__(self, embedder, index_path="index/index.faiss", meta_path="index/metadata.json"):
+    def __init__(self, embedder, index_path="index/index.faiss", meta_path="index/metadata.json",
+                 nprobe=None, ef_search=None):
         """
         Khởi tạo ProjectSearcher
         
-
+        Tham số search (nprobe / efSearch) được đọc từ manifest.json cạnh index;
+        truyền nprobe / ef_search để ghi đè.
+        Metadata được đọc từ <meta_path>.db nếu có (chỉ tra các dòng cần),
+        ngược lại load cả metadata.json như cũ.
         """
         self.embedder = embedder
         
@@ -28,15 +61,78 @@ class ProjectSearcher:
         self.index = faiss.read_index(str(index_path))
         print(f"Đã load index: {self.index.ntotal} vectors")
         
-        # Load metadata
-        meta_path = Path(meta_path)
-        if not meta_path.exists():
-            raise FileNotFoundError(f"Không tìm thấy metadata: {meta_path}")
+        # Áp dụng tham số search đã lưu lúc build
+        search_params = {}
+        manifest_path = index_path.with_name("manifest.json")
+        if manifest_path.exists():
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                search_params = json.load(f).get("search_params", {})
+        if nprobe is not None:
+            search_params['nprobe'] = nprobe
+        if ef_search is not None:
+            search_params['efSearch'] = ef_search
+        if search_params:
+            apply_search_params(self.index, search_params)
+            print(f"Search params: {search_params}")
         
-        with open(meta_path, 'r', encoding='utf-8') as f:
-            self.metadata = json.load(f)
+        # Load metadata (store SQLite hoặc metadata.json cũ)
+        self.metadata = open_metadata(meta_path)
+        print(f"Đã load metadata: {len(self.metadata)} items ({type(self.metadata).__name__})")
+        self._project_of = None
+        self._project_images = None
         
-        print(f"Đã load metadata: {len(self.metadata)} items")
+        # Index centroid theo project (tầng 1 của search_two_level), load khi dùng
+        self.project_index_path = index_path.with_name("project_index.faiss")
+        self._project_index = None
+    
+    @staticmethod
+    def _make_result(project_id, meta, score, image_name, image_path, num_matches):
+        """Tạo result object cho 1 project"""
+        return {
+            'project_id': project_id,
+            'title': meta.get('title', 'N/A'),
+            'similarity_score': score,
+            'matched_image': image_name,
+            'matched_image_path': image_path,
+            'tech_stack': meta.get('tech_stack', []),
+            'estimate_days': meta.get('estimate_days', 'N/A'),
+            'repo_url': meta.get('repo_url', ''),
+            'tags': meta.get('tags', []),
+            'description': meta.get('description', ''),
+            'num_matches': num_matches,  # Số lượng ảnh khớp của project này
+        }
+    
+    @property
+    def project_of(self):
+        """Mảng int32: image id -> project index (-1 nếu không có), load lần đầu dùng"""
+        if self._project_of is None:
+            self._project_of = self.metadata.project_index_array()
+        return self._project_of
+    
+    @property
+    def project_images(self):
+        """
+        Ảnh của từng project dạng CSR, tính 1 lần từ project_of:
+        (image_ids, offsets) - ảnh của project p là image_ids[offsets[p]:offsets[p + 1]]
+        """
+        if self._project_images is None:
+            project_of = self.project_of
+            valid = np.flatnonzero(project_of >= 0)
+            image_ids = valid[np.argsort(project_of[valid], kind='stable')].astype('int64')
+            counts = np.bincount(project_of[valid], minlength=int(project_of.max(initial=-1)) + 1)
+            offsets = np.concatenate(([0], np.cumsum(counts))).astype('int64')
+            self._project_images = (image_ids, offsets)
+        return self._project_images
+    
+    @property
+    def project_index(self):
+        """Index centroid theo project do ProjectIndexer.save ghi ra"""
+        if self._project_index is None:
+            if not self.project_index_path.exists():
+                raise FileNotFoundError(f"Không tìm thấy project index: {self.project_index_path} "
+                                        f"(build lại index để tạo)")
+            self._project_index = faiss.read_index(str(self.project_index_path))
+        return self._project_index
     
     def search(self, query_image_path, top_k=5, search_k=None):
         """
@@ -47,24 +143,34 @@ class ProjectSearcher:
         print(f"Đang tìm kiếm cho: {query_image_path}")
         query_emb = self.embedder.embed_image(query_image_path)
         
-        # Tìm kiếm K-nearest neighbors
         # Lấy nhiều kết quả hơn top_k vì mỗi project có nhiều ảnh
         if search_k is None:
             search_k = top_k * 3
         
+        # Trả về top_k kết quả
+        return self._search_embedding(query_emb, search_k)[:top_k]
+    
+    def _search_embedding(self, query_emb, search_k):
+        """
+        Tìm search_k ảnh gần nhất và group theo project
+        Returns: tất cả project tìm được, sắp xếp theo similarity (cao -> thấp)
+        """
         search_k = min(search_k, self.index.ntotal)  # Không vượt quá tổng số vectors
         
+        # Tìm kiếm K-nearest neighbors
         scores, indices = self.index.search(query_emb, search_k)
         
+        # Chỉ tra metadata của các ảnh trả về
+        # (id không hợp lệ / ảnh đã bị gỡ khỏi index sẽ không có trong kết quả)
+        metas = self.metadata.get_many(indices[0])
+        
         # Group kết quả theo project_id
         project_matches = defaultdict(list)
         
         for score, idx in zip(scores[0], indices[0]):
-            # Bỏ qua nếu index không hợp lệ
-            if idx < 0 or idx >= len(self.metadata):
+            meta = metas.get(int(idx))
+            if meta is None:
                 continue
-            
-            meta = self.metadata[idx]
             project_id = meta['project_id']
             
             # Lưu thông tin match
@@ -83,72 +189,236 @@ class ProjectSearcher:
             best_match = max(matches, key=lambda x: x['score'])
             meta = best_match['metadata']
             
-            # Tạo result object
-            result = {
-                'project_id': project_id,
-                'title': meta.get('title', 'N/A'),
-                'similarity_score': best_match['score'],
-                'matched_image': best_match['image_name'],
-                'matched_image_path': best_match['image_path'],
-                'tech_stack': meta.get('tech_stack', []),
-                'estimate_days': meta.get('estimate_days', 'N/A'),
-                'repo_url': meta.get('repo_url', ''),
-                'tags': meta.get('tags', []),
-                'description': meta.get('description', ''),
-                'num_matches': len(matches),  # Số lượng ảnh khớp của project này
-            }
+            result = self._make_result(project_id, meta, best_match['score'], best_match['image_name'],
+                                       best_match['image_path'], len(matches))
             
             results.append(result)
         
         # Sắp xếp theo điểm similarity (cao -> thấp)
         results.sort(key=lambda x: x['similarity_score'], reverse=True)
         
-        # Trả về top_k kết quả
-        return results[:top_k]
+        return results
     
-    def search_with_filters(self, query_image_path, top_k=5, filters=None):
+    def search_two_level(self, query_image_path, top_k=5, shortlist=None,
+                         aggregation="max", top_m=3, temperature=0.05):
         """
-        Tìm kiếm với filters (lọc theo tech_stack, tags, estimate time, etc.)
+        Tìm kiếm 2 tầng: xếp hạng thô theo centroid project, rồi rerank ảnh
+        của các project trong shortlist
+        
+        Mọi ảnh của project trong shortlist đều được chấm điểm, nên project có hàng
+        trăm ảnh gần giống nhau không chiếm hết candidate pool như search().
+        
+        Args:
+            top_k: số project trả về
+            shortlist: số project lấy ở tầng 1 (mặc định max(4 * top_k, 20))
+            aggregation: 'max' | 'mean_topm' | 'softmax_sum' (xem aggregate_scores)
+            top_m, temperature: tham số của mean_topm / softmax_sum
+        
+        Returns:
+            list result cùng format với search(); similarity_score là điểm đã gộp,
+            num_matches là số ảnh của project được rerank
         """
-        # Tìm kiếm thông thường trước
-        # Lấy nhiều kết quả hơn để sau khi filter vẫn đủ top_k
-        results = self.search(query_image_path, top_k=top_k * 3)
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Aggregation không hợp lệ: {aggregation} (chọn 1 trong {AGGREGATIONS})")
         
-        if filters is None:
-            return results[:top_k]
+        print(f"Đang tìm kiếm cho: {query_image_path}")
+        query_emb = self.embedder.embed_image(query_image_path)
+        
+        # Tầng 1: shortlist project theo centroid
+        if shortlist is None:
+            shortlist = max(top_k * 4, 20)
+        shortlist = min(shortlist, self.project_index.ntotal)
+        _, project_ids = self.project_index.search(query_emb, shortlist)
+        project_ids = project_ids[0][project_ids[0] >= 0]
+        
+        # Tầng 2: chấm điểm tất cả ảnh của các project đó (cắt từ CSR, không quét cả index)
+        image_ids, offsets = self.project_images
+        project_ids = project_ids[project_ids < len(offsets) - 1]
+        starts, ends = offsets[project_ids], offsets[project_ids + 1]
+        if not (ends > starts).any():
+            return []
+        candidates = np.concatenate([image_ids[a:b] for a, b in zip(starts, ends)])
+        
+        vectors = self.index.reconstruct_batch(candidates)
+        scores = vectors @ query_emb[0]
+        
+        # Ảnh của mỗi project nằm liền nhau trong candidates
+        bounds = np.concatenate(([0], np.cumsum(ends - starts)))
+        ranked = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if end == start:
+                continue
+            group_scores = scores[start:end]
+            best = start + int(np.argmax(group_scores))
+            ranked.append((aggregate_scores(group_scores, aggregation, top_m, temperature),
+                           int(candidates[best]), float(scores[best]), int(end - start)))
+        
+        ranked.sort(key=lambda x: x[0], reverse=True)
+        ranked = ranked[:top_k]
+        
+        metas = self.metadata.get_many([image_id for _, image_id, _, _ in ranked])
+        results = []
+        for score, image_id, _, count in ranked:
+            meta = metas.get(image_id)
+            if meta is None:
+                continue
+            results.append(self._make_result(meta['project_id'], meta, score, meta['image_name'],
+                                             meta['image_path'], count))
+        return results
+    
+    def _group_batch(self, scores, indices, top_k):
+        """
+        Group kết quả của cả batch theo project bằng numpy (không lặp từng hit)
+        
+        FAISS trả về kết quả đã sắp xếp theo score giảm dần, nên hit đầu tiên của
+        mỗi (query, project) là match tốt nhất của project đó.
+        
+        Returns:
+            list (mỗi query 1 phần tử) các list (image_id, score, num_matches),
+            đã sắp xếp theo score, tối đa top_k project
+        """
+        num_queries, k = indices.shape
+        project_of = self.project_of
+        
+        ids = indices.ravel()
+        valid = (ids >= 0) & (ids < len(project_of))
+        projects = np.full(ids.shape, -1, dtype=np.int64)
+        projects[valid] = project_of[ids[valid]]
+        valid &= projects >= 0
+        
+        rows = np.repeat(np.arange(num_queries), k)[valid]
+        positions = np.flatnonzero(valid)
+        keys = rows * (int(project_of.max(initial=0)) + 1) + projects[valid]
+        
+        # first = vị trí hit tốt nhất của mỗi (query, project), counts = số ảnh khớp
+        _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        best = positions[first]
+        best_rows = rows[first]
+        
+        # Trong mỗi query: sắp xếp project theo vị trí hit tốt nhất (= theo score)
+        order = np.lexsort((best, best_rows))
+        best, best_rows, counts = best[order], best_rows[order], counts[order]
         
-        filtered_results = []
+        grouped = [[] for _ in range(num_queries)]
+        flat_scores = scores.ravel()
+        for pos, row, count in zip(best, best_rows, counts):
+            if len(grouped[row]) < top_k:
+                grouped[row].append((int(ids[pos]), float(flat_scores[pos]), int(count)))
+        return grouped
+    
+    def search_many(self, queries, top_k=5, search_k=None, batch_size=64, num_workers=None):
+        """
+        Tìm kiếm cho nhiều ảnh query (job dedup offline)
+        
+        Embed query theo batch (pipeline của ImageEmbedder.iter_embeddings), mỗi batch
+        1 lần index.search, group theo project bằng numpy. Kết quả được yield dần
+        nên bộ nhớ chỉ phụ thuộc batch_size, không phụ thuộc số query.
+        
+        Args:
+            queries: list đường dẫn ảnh hoặc ảnh CV2 (numpy BGR)
+            top_k: số project mỗi query
+            search_k: số ảnh lấy từ index cho mỗi query (mặc định top_k * 3)
+            batch_size: số query mỗi lần embed + search
+            num_workers: số worker decode ảnh
+        
+        Yields:
+            (query_index, results) theo đúng thứ tự queries;
+            results cùng format với search() ([] nếu ảnh query lỗi)
+        """
+        if search_k is None:
+            search_k = top_k * 3
+        search_k = min(search_k, self.index.ntotal)
         
-        for result in results:
-            # Kiểm tra filters
-            if 'tech_stack' in filters:
-                required_tech = filters['tech_stack']
-                if not any(tech in result['tech_stack'] for tech in required_tech):
-                    continue
+        next_index = 0
+        for indices, embeddings in self.embedder.iter_embeddings(queries, batch_size=batch_size,
+                                                                  num_workers=num_workers):
+            scores, ids = self.index.search(np.ascontiguousarray(embeddings, dtype='float32'), search_k)
+            grouped = self._group_batch(scores, ids, top_k)
             
-            if 'tags' in filters:
-                required_tags = filters['tags']
-                if not any(tag in result['tags'] for tag in required_tags):
-                    continue
+            # Tra metadata 1 lần cho cả batch
+            metas = self.metadata.get_many({image_id for hits in grouped for image_id, _, _ in hits})
             
-            if 'max_days' in filters:
-                if result['estimate_days'] != 'N/A':
-                    if result['estimate_days'] > filters['max_days']:
+            for query_index, hits in zip(indices, grouped):
+                # Query bị bỏ qua (ảnh lỗi) -> kết quả rỗng
+                while next_index < query_index:
+                    yield next_index, []
+                    next_index += 1
+                
+                results = []
+                for image_id, score, count in hits:
+                    meta = metas.get(image_id)
+                    if meta is None:
                         continue
+                    results.append(self._make_result(meta['project_id'], meta, score, meta['image_name'],
+                                                     meta['image_path'], count))
+                yield query_index, results
+                next_index = query_index + 1
+        
+        while next_index < len(queries):
+            yield next_index, []
+            next_index += 1
+    
+    @staticmethod
+    def _passes_filters(result, filters):
+        """Kiểm tra 1 result có thoả filters không"""
+        if 'tech_stack' in filters:
+            required_tech = filters['tech_stack']
+            if not any(tech in result['tech_stack'] for tech in required_tech):
+                return False
+        
+        if 'tags' in filters:
+            required_tags = filters['tags']
+            if not any(tag in result['tags'] for tag in required_tags):
+                return False
+        
+        if 'max_days' in filters:
+            if result['estimate_days'] != 'N/A':
+                if result['estimate_days'] > filters['max_days']:
+                    return False
+        
+        if 'min_similarity' in filters:
+            if result['similarity_score'] < filters['min_similarity']:
+                return False
+        
+        return True
+    
+    def search_with_filters(self, query_image_path, top_k=5, filters=None, search_k=None):
+        """
+        Tìm kiếm với filters (lọc theo tech_stack, tags, estimate time, etc.)
+        
+        search_k tăng gấp đôi cho tới khi đủ top_k project thoả filters (hoặc đã
+        duyệt hết index). Project tìm thấy trong search_k ảnh đầu luôn có match
+        tốt nhất của nó trong đó, nên top_k kết quả giống hệt việc lọc toàn bộ index.
+        """
+        if filters is None:
+            return self.search(query_image_path, top_k=top_k, search_k=search_k)
+        
+        print(f"Đang tìm kiếm cho: {query_image_path}")
+        query_emb = self.embedder.embed_image(query_image_path)
+        
+        if search_k is None:
+            search_k = top_k * 3
+        min_similarity = filters.get('min_similarity')
+        
+        while True:
+            results = self._search_embedding(query_emb, search_k)
+            filtered_results = [r for r in results if self._passes_filters(r, filters)]
             
-            if 'min_similarity' in filters:
-                if result['similarity_score'] < filters['min_similarity']:
-                    continue
+            if len(filtered_results) >= top_k or search_k >= self.index.ntotal:
+                break
             
-            filtered_results.append(result)
+            # Ảnh xa hơn đã dưới min_similarity -> tìm sâu hơn cũng không thêm được kết quả
+            if min_similarity is not None and results and results[-1]['similarity_score'] < min_similarity:
+                break
+            
+            search_k *= 2
         
         return filtered_results[:top_k]
 
-
 def test_searcher():
     print("TEST PROJECT SEARCHER")
     
-    from embedding import ImageEmbedder
+    from src.embedding import ImageEmbedder
     
     # Kiểm tra index có tồn tại không
     index_path = Path("index/index.faiss")
@@ -4,6 +4,7 @@ Phân loại các UI components thành semantic types (header, hero, footer, CTA
 Sử dụng hybrid approach: Rules + CLIP zero-shot
 """
 
+import importlib.util
 from typing import List, Dict, Tuple
 import numpy as np
 
@@ -18,8 +19,7 @@ class SemanticClassifier:
             use_clip: Enable CLIP zero-shot classification (slower but more accurate)
         """
         self.use_clip = use_clip
-        self.clip_model = None
-        self.clip_preprocess = None
+        self.clip_model_name = "ViT-B/32"
         
         if use_clip:
             self._init_clip()
@@ -69,14 +69,17 @@ class SemanticClassifier:
     def _init_clip(self):
         """Initialize CLIP model for zero-shot classification"""
         try:
-            import clip
-            import torch
+            from src.model_registry import resolve_device
+
+            # Only check that CLIP is installed; the model itself is loaded on first use
+            if importlib.util.find_spec("clip") is None:
+                raise ImportError("clip")
             
             # Determine device
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.device = resolve_device()
             
-            # Load CLIP model
-            self.clip_model, self.clip_preprocess = clip.load("ViT-B/32", device=self.device)
+            # CLIP model itself is loaded lazily from the shared registry
+            # (see clip_model / clip_preprocess properties)
             
             # ENHANCED text prompts - ALIGNED WITH USER REQUEST
             self.clip_prompts = {
@@ -111,12 +114,27 @@ class SemanticClassifier:
                 'social_links': "social media icons row with logos for facebook twitter instagram linkedin",
             }
             
-            print(f"[INFO] CLIP model loaded on {self.device} for semantic classification")
+            print(f"[INFO] CLIP semantic classification enabled on {self.device}")
             
         except ImportError:
             print("[WARN] CLIP not available. Install: pip install git+https://github.com/openai/CLIP.git")
             self.use_clip = False
     
+    @property
+    def clip_model(self):
+        """Shared CLIP model (None when CLIP classification is disabled)"""
+        if not self.use_clip:
+            return None
+        from src.model_registry import get_clip
+        return get_clip(self.clip_model_name, self.device)[0]
+    
+    @property
+    def clip_preprocess(self):
+        if not self.use_clip:
+            return None
+        from src.model_registry import get_clip
+        return get_clip(self.clip_model_name, self.device)[1]
+    
     def classify(self, component: Dict, img_shape: Tuple[int, int], all_components: List[Dict] = None) -> str:
         """
         Hybrid Classification: Rules -> CLIP -> Validation
@@ -25,6 +25,24 @@ class TextEmbedder:
         embedding = self.model.encode(text, convert_to_numpy=True)
         return embedding.tolist()
 
+    def embed_batch(self, texts, batch_size=64):
+        """
+        Input: List[str]
+        Output: List[List[float] | None], cùng thứ tự với texts
+                (None cho phần tử rỗng / không phải str, giống embed())
+        """
+        valid = [i for i, text in enumerate(texts) if text and isinstance(text, str)]
+        results = [None] * len(texts)
+        if not valid:
+            return results
+        
+        # 1 lần encode cho cả list, SentenceTransformer tự chia batch
+        embeddings = self.model.encode([texts[i] for i in valid], batch_size=batch_size,
+                                       convert_to_numpy=True)
+        for i, embedding in zip(valid, embeddings):
+            results[i] = embedding.tolist()
+        return results
+
 if __name__ == "__main__":
     # Test nhanh
     embedder = TextEmbedder()
@@ -0,0 +1,394 @@
+"""
+Regression tests for UIComponentDetector post-processing (NMS, clustering, SAM crops)
+ and layout detection (background bands, XY-cut)
+Run: python -m pytest -q test_component_detector.py
+     python test_component_detector.py   (also prints a micro-benchmark)
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.getcwd())
+
+import numpy as np
+
+from src.component_detector import UIComponentDetector
+
+
+def _reference_nms(detector, components, iou_threshold):
+    """Original pairwise Python NMS"""
+    components = sorted(components, key=lambda c: c.get('confidence', 0), reverse=True)
+    keep = []
+    for comp in components:
+        if all(detector._calculate_iou(comp['bbox'], k['bbox']) <= iou_threshold for k in keep):
+            keep.append(comp)
+    return keep
+
+
+def _reference_clusters(components, distance_threshold):
+    """Original agglomerative loop (min center distance between clusters)"""
+    def dist(c1, c2):
+        x1, y1, w1, h1 = c1['bbox']
+        x2, y2, w2, h2 = c2['bbox']
+        return ((x1 + w1/2 - x2 - w2/2)**2 + (y1 + h1/2 - y2 - h2/2)**2)**0.5
+
+    clusters = [[comp] for comp in components]
+    merged = True
+    while merged:
+        merged = False
+        new_clusters = []
+        used = set()
+        for i, cluster1 in enumerate(clusters):
+            if i in used:
+                continue
+            for j, cluster2 in enumerate(clusters):
+                if i >= j or j in used:
+                    continue
+                if min(dist(a, b) for a in cluster1 for b in cluster2) < distance_threshold:
+                    cluster1.extend(cluster2)
+                    used.add(j)
+                    merged = True
+            new_clusters.append(cluster1)
+            used.add(i)
+        clusters = new_clusters
+    return clusters
+
+
+def _sample_components(n, seed=0, unique_scores=False):
+    """SAM-like output: many overlapping boxes, some exact duplicates and tied scores"""
+    rng = np.random.default_rng(seed)
+    components = []
+    for i in range(n):
+        if components and rng.random() < 0.2:
+            # Jittered copy of an earlier box
+            x, y, w, h = components[rng.integers(len(components))]['bbox']
+            bbox = [max(0, x + int(rng.integers(-8, 9))), max(0, y + int(rng.integers(-8, 9))), w, h]
+        else:
+            bbox = [int(rng.integers(0, 1000)), int(rng.integers(0, 2000)),
+                    int(rng.integers(20, 600)), int(rng.integers(20, 600))]
+        score = rng.random() if unique_scores else round(rng.uniform(0.8, 1.0), 2)
+        components.append({'id': i, 'bbox': bbox, 'confidence': float(score)})
+    return components
+
+
+def _ids(components):
+    return [c['id'] for c in components]
+
+
+def test_numpy_nms_matches_reference():
+    detector = UIComponentDetector(method='rule_based')
+    for seed in range(5):
+        comps = _sample_components(300, seed)
+        for thr in (0.3, 0.5, 0.7):
+            expected = _ids(_reference_nms(detector, comps, thr))
+            got = _ids(detector._non_max_suppression(comps, iou_threshold=thr))
+            assert got == expected, (seed, thr)
+
+
+def test_library_backends_keep_same_set():
+    import pytest
+    detector = UIComponentDetector(method='rule_based')
+    backends = ['cv2']
+    try:
+        import torchvision  # noqa: F401
+        backends.append('torchvision')
+    except ImportError:
+        pass
+
+    for seed in range(3):
+        # Distinct scores: library NMS does not promise an order for ties
+        comps = _sample_components(300, seed, unique_scores=True)
+        expected = set(_ids(_reference_nms(detector, comps, 0.7)))
+        for backend in backends:
+            got = _ids(detector._non_max_suppression(comps, iou_threshold=0.7, backend=backend))
+            assert set(got) == expected, backend
+
+    with pytest.raises(ValueError):
+        detector._non_max_suppression(comps, backend='bogus')
+
+
+def test_empty_input():
+    detector = UIComponentDetector(method='rule_based')
+    assert detector._non_max_suppression([]) == []
+
+
+def _check_clusters_match_reference():
+    detector = UIComponentDetector(method='rule_based')
+    img_w, img_h = 1200, 400
+    for seed in range(5):
+        # Distinct image per component: merged section shows its first member's crop
+        comps = [{**c, 'image': np.zeros((1, 1, 3), np.uint8)} for c in _sample_components(120, seed)]
+        # Boxes whose centers are exactly `threshold` apart must stay separate (strict <)
+        comps += [{'id': 1000, 'bbox': [0, 5000, 10, 10], 'confidence': 0.9,
+                   'image': np.zeros((1, 1, 3), np.uint8)},
+                  {'id': 1001, 'bbox': [0, 5000 + img_h // 4, 10, 10], 'confidence': 0.9,
+                   'image': np.zeros((1, 1, 3), np.uint8)}]
+
+        expected = _reference_clusters([dict(c) for c in comps], img_h * 0.25)
+        sections = detector._cluster_components(comps, img_w, img_h)
+
+        assert len(sections) == len(expected)
+        for section, cluster in zip(sections, expected):
+            ref = detector._merge_components(cluster, 'card', img_w, img_h)
+            assert section['bbox'] == ref['bbox']
+            assert section['image'] is ref['image']
+            assert abs(section['confidence'] - ref['confidence']) < 1e-9
+
+
+def test_clusters_match_reference():
+    _check_clusters_match_reference()
+
+
+def test_clusters_match_reference_without_scipy(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'scipy.spatial', None)
+    _check_clusters_match_reference()
+
+
+def _encode_rle(mask):
+    """Uncompressed RLE như SAM (column-major, run đầu tiên là số 0)"""
+    flat = mask.T.reshape(-1)
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], change, [flat.size]))
+    counts = np.diff(bounds).tolist()
+    return {'size': list(mask.shape), 'counts': counts if not flat[0] else [0] + counts}
+
+
+class _FakeMaskGenerator:
+    """Trả về các mask hình chữ nhật/elip cố định, dạng binary hoặc RLE"""
+
+    def __init__(self, output_mode):
+        self.output_mode = output_mode
+
+    def generate(self, image):
+        h, w = image.shape[:2]
+        rng = np.random.default_rng(1)
+        yy, xx = np.mgrid[0:h, 0:w]
+        masks = []
+        for _ in range(40):
+            cx, cy = rng.integers(0, w), rng.integers(0, h)
+            rx, ry = rng.integers(20, w // 3), rng.integers(20, h // 3)
+            mask = ((xx - cx) / rx) ** 2 + ((yy - cy) / ry) ** 2 <= 1
+            ys, xs = np.nonzero(mask)
+            bbox = [int(xs.min()), int(ys.min()), int(np.ptp(xs)) + 1, int(np.ptp(ys)) + 1]
+            masks.append({
+                'segmentation': _encode_rle(mask) if self.output_mode == 'uncompressed_rle' else mask,
+                'bbox': bbox,
+                'predicted_iou': float(rng.uniform(0.75, 1.0)),
+            })
+        return masks
+
+
+def test_rle_region_matches_full_decode():
+    rng = np.random.default_rng(0)
+    mask = rng.random((57, 83)) < 0.3
+    mask[:, 0] = True  # RLE bắt đầu bằng run 1
+    rle = _encode_rle(mask)
+    for x, y, w, h in [(0, 0, 83, 57), (10, 5, 20, 30), (82, 56, 1, 1), (0, 20, 5, 37)]:
+        region = UIComponentDetector._rle_region(rle, x, y, w, h)
+        assert np.array_equal(region, mask[y:y+h, x:x+w])
+
+
+def test_sam_rle_and_binary_give_same_components():
+    img = (np.random.default_rng(2).random((700, 500, 3)) * 255).astype(np.uint8)
+    results = {}
+    for mode in ('binary_mask', 'uncompressed_rle'):
+        for max_side in (None, 300):
+            detector = UIComponentDetector(method='rule_based')
+            detector.mask_generator = _FakeMaskGenerator(mode)
+            detector.sam_max_side = max_side
+            results[mode, max_side] = detector._detect_sam(img)
+
+    for max_side in (None, 300):
+        binary, rle = results['binary_mask', max_side], results['uncompressed_rle', max_side]
+        assert len(binary) == len(rle) > 0
+        for a, b in zip(binary, rle):
+            assert a['bbox'] == b['bbox']
+            assert np.array_equal(a['image'], b['image'])
+            assert '_mask' not in a
+
+
+
+class _FakePredictor:
+    """set_image đếm số lần chạy 'encoder'; features phụ thuộc nội dung ảnh"""
+
+    def __init__(self):
+        self.encoder_calls = 0
+        self.reset_image()
+
+    def reset_image(self):
+        self.features = self.original_size = self.input_size = None
+        self.is_image_set = False
+
+    def set_image(self, image, image_format="RGB"):
+        self.encoder_calls += 1
+        self.features = float(image.mean())
+        self.original_size = self.input_size = image.shape[:2]
+        self.is_image_set = True
+
+
+class _CachingMaskGenerator(_FakeMaskGenerator):
+    """Giống SamAutomaticMaskGenerator: set_image trên predictor trước khi sinh mask"""
+
+    def __init__(self):
+        super().__init__('binary_mask')
+        self.predictor = _FakePredictor()
+        self.seen_features = []
+
+    def generate(self, image):
+        self.predictor.set_image(image)
+        self.seen_features.append(self.predictor.features)
+        return super().generate(image)
+
+
+def test_sam_embedding_cache():
+    rng = np.random.default_rng(3)
+    img_a = (rng.random((300, 200, 3)) * 255).astype(np.uint8)
+    img_b = (rng.random((300, 200, 3)) * 255).astype(np.uint8)
+
+    detector = UIComponentDetector(method='rule_based')
+    detector.mask_generator = generator = _CachingMaskGenerator()
+    detector._enable_embedding_cache(2)
+    predictor = generator.predictor
+
+    first = detector._detect_sam(img_a)
+    assert predictor.encoder_calls == 1
+
+    # Cùng ảnh -> không chạy encoder, features được khôi phục
+    second = detector._detect_sam(img_a)
+    assert predictor.encoder_calls == 1
+    assert detector.embedding_cache_hits == 1
+    assert generator.seen_features[1] == generator.seen_features[0]
+    assert [c['bbox'] for c in second] == [c['bbox'] for c in first]
+
+    # Ảnh khác -> miss
+    detector._detect_sam(img_b)
+    assert predictor.encoder_calls == 2
+    assert detector.embedding_cache_hits == 1
+    assert generator.seen_features[2] == float(img_b.mean())
+
+
+
+def _layout_ink():
+    """Ink map: 2 khối cạnh nhau (A, B) phía trên, 1 khối rộng (C) phía dưới"""
+    ink = np.zeros((100, 120), dtype=bool)
+    ink[10:30, 10:50] = True    # A
+    ink[10:30, 70:110] = True   # B
+    ink[60:90, 10:110] = True   # C
+    return ink
+
+
+def _xy_leaves(max_depth):
+    detector = UIComponentDetector(method='layout')
+    detector.layout_max_depth = max_depth
+    leaves = []
+    detector._xy_cut(_layout_ink(), 0, 0, 120, 100, 0, 5, leaves)
+    return [(int(x), int(y), int(w), int(h), round(conf, 3)) for x, y, w, h, conf in leaves]
+
+
+def test_whitespace_runs():
+    profile = np.array([1, 0, 0, 0, 1, 0, 1, 0, 0], dtype=bool)
+    # Đoạn trống ở 2 đầu và đoạn ngắn hơn min_gap bị bỏ
+    assert UIComponentDetector._whitespace_runs(profile, 2) == [(1, 4)]
+    assert UIComponentDetector._whitespace_runs(profile, 1) == [(1, 4), (5, 6)]
+    assert UIComponentDetector._whitespace_runs(np.zeros(5, dtype=bool), 1) == []
+
+
+def test_xy_cut_positions():
+    assert _xy_leaves(4) == [
+        (10, 10, 40, 20, 0.85),     # A: cắt ngang rồi cắt dọc
+        (70, 10, 40, 20, 0.85),     # B
+        (10, 60, 100, 30, 0.875),   # C: không còn khoảng trắng
+    ]
+
+
+def test_xy_cut_depth_limit():
+    # Tầng 1 là lá: A + B không bị tách
+    assert _xy_leaves(1) == [(10, 10, 100, 20, 0.875), (10, 60, 100, 30, 0.875)]
+    # Không cắt: bbox của toàn bộ ink
+    assert _xy_leaves(0) == [(10, 10, 100, 80, 0.9)]
+
+
+def _layout_page():
+    """Trang 600x400: header tối, body trắng với 3 card, footer màu"""
+    img = np.full((600, 400, 3), 255, np.uint8)
+    img[:80] = (40, 40, 40)
+    img[520:] = (90, 60, 30)
+    img[150:300, 40:130] = (200, 120, 60)
+    img[150:300, 270:360] = (60, 160, 200)
+    img[360:460, 40:150] = (180, 180, 180)
+    # Đường kẻ mỏng không tạo band mới
+    img[100:102] = (0, 0, 0)
+    return img
+
+
+def test_background_bands():
+    detector = UIComponentDetector(method='layout')
+    bands = detector._background_bands(_layout_page())
+    assert [(y0, y1) for y0, y1, _ in bands] == [(0, 80), (80, 520), (520, 600)]
+    assert [c.tolist() for _, _, c in bands] == [[40, 40, 40], [255, 255, 255], [90, 60, 30]]
+
+
+def test_detect_layout_finds_bands_and_blocks():
+    detector = UIComponentDetector(method='layout')
+    components = detector._detect_layout(_layout_page())
+    boxes = [c['bbox'] for c in components]
+
+    assert [0, 0, 400, 80] in boxes
+    assert [0, 520, 400, 80] in boxes
+    # Mỗi card được tìm thấy (sai số vài pixel do edge map)
+    for x, y, w, h in [(40, 150, 90, 150), (270, 150, 90, 150), (40, 360, 110, 100)]:
+        assert any(abs(bx - x) <= 4 and abs(by - y) <= 4 and abs(bw - w) <= 8 and abs(bh - h) <= 8
+                   for bx, by, bw, bh in boxes), (x, y, w, h)
+    for c in components:
+        x, y, w, h = c['bbox']
+        assert c['image'].shape[:2] == (h, w)
+
+
+def test_detect_layout_uniform_and_tiny_images():
+    detector = UIComponentDetector(method='layout')
+    assert detector._detect_layout(np.full((500, 300, 3), 128, np.uint8)) == []
+    assert detector._detect_layout(np.zeros((10, 10, 3), np.uint8)) == []
+    assert detector._detect_layout(np.zeros((1, 1, 3), np.uint8)) == []
+
+
+def benchmark(n=500, repeat=5):
+    detector = UIComponentDetector(method='rule_based')
+    comps = _sample_components(n, unique_scores=True)
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat * 1000
+
+    print(f"NMS on {n} boxes (ms/call):")
+    print(f"  python loop : {timed(lambda: _reference_nms(detector, comps, 0.7)):8.2f}")
+    for backend in ('numpy', 'cv2', 'torchvision'):
+        try:
+            ms = timed(lambda: detector._non_max_suppression(comps, 0.7, backend=backend))
+        except ImportError:
+            continue
+        print(f"  {backend:<12}: {ms:8.2f}")
+
+    comps = _sample_components(n // 2)
+    print(f"Clustering {n // 2} boxes (ms/call):")
+    print(f"  python loop : {timed(lambda: _reference_clusters([dict(c) for c in comps], 100)):8.2f}")
+    print(f"  union-find  : {timed(lambda: detector._cluster_components(comps, 1200, 400)):8.2f}")
+
+
+if __name__ == "__main__":
+    test_numpy_nms_matches_reference()
+    test_library_backends_keep_same_set()
+    test_empty_input()
+    test_clusters_match_reference()
+    test_rle_region_matches_full_decode()
+    test_sam_rle_and_binary_give_same_components()
+    test_sam_embedding_cache()
+    test_whitespace_runs()
+    test_xy_cut_positions()
+    test_xy_cut_depth_limit()
+    test_background_bands()
+    test_detect_layout_finds_bands_and_blocks()
+    test_detect_layout_uniform_and_tiny_images()
+    print("✓ NMS, clustering, SAM crops and layout detection match reference")
+    benchmark()
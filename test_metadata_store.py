@@ -0,0 +1,51 @@
+"""
+Regression tests for MetadataStore (SQLite metadata of the FAISS index)
+Run: python -m pytest -q test_metadata_store.py
+"""
+
+import sys
+import os
+sys.path.append(os.getcwd())
+
+from src.metadata_store import MetadataStore
+
+
+def _metadata(n_projects):
+    """One image per project, image id == project idx"""
+    return [
+        {'project_id': f'p{i}', 'title': f'Project {i}',
+         'image_path': f'/data/p{i}/img.png', 'image_name': 'img.png', 'project_folder': f'p{i}'}
+        for i in range(n_projects)
+    ]
+
+
+def test_get_many_with_small_project_cache(tmp_path):
+    db_path = tmp_path / 'metadata.db'
+    MetadataStore.write(db_path, _metadata(8))
+    store = MetadataStore(db_path, project_cache_size=4)
+
+    store.get_many([0, 1, 2])
+    # Cache overflows: image 0 is a hit, 5 and 6 are fetched
+    result = store.get_many([0, 5, 6])
+    assert sorted(result) == [0, 5, 6]
+    for image_id, meta in result.items():
+        assert meta['project_id'] == f'p{image_id}'
+    assert len(store._project_cache) <= 4
+
+    # More projects than the cache holds in a single call
+    result = store.get_many(range(8))
+    assert [result[i]['project_id'] for i in range(8)] == [f'p{i}' for i in range(8)]
+    assert len(store._project_cache) <= 4
+    store.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    db_path = tmp_path / 'metadata.db'
+    MetadataStore.write(db_path, _metadata(8))
+    store = MetadataStore(db_path, project_cache_size=3)
+
+    store.get_many([0, 1, 2])
+    store.get_many([0])
+    store.get_many([3])
+    assert list(store._project_cache) == [2, 0, 3]
+    store.close()
@@ -0,0 +1,270 @@
+"""
+Tests for PostgresDB pooled mode (no database needed: the pool is faked)
+Run: python -m pytest -q test_postgres_db.py
+"""
+
+import sys
+import os
+import threading
+import time
+sys.path.append(os.getcwd())
+
+import psycopg2
+import pytest
+from psycopg2.pool import PoolError
+
+import src.postgres_db as postgres_db
+from src.postgres_db import PostgresDB
+
+
+class _FakeConnection:
+    closed = 0
+    autocommit = False
+
+    class info:
+        transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class _FakePool:
+    """Behaves like ThreadedConnectionPool: getconn raises once maxconn are out"""
+
+    def __init__(self, minconn, maxconn, dsn):
+        self.maxconn = maxconn
+        self.lock = threading.Lock()
+        self.out = 0
+        self.peak = 0
+
+    def getconn(self):
+        with self.lock:
+            if self.out >= self.maxconn:
+                raise PoolError("connection pool exhausted")
+            self.out += 1
+            self.peak = max(self.peak, self.out)
+        return _FakeConnection()
+
+    def putconn(self, conn, close=False):
+        with self.lock:
+            self.out -= 1
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(postgres_db, 'ThreadedConnectionPool', _FakePool)
+    monkeypatch.setattr(postgres_db, 'register_vector', lambda conn: None)
+
+
+def test_more_concurrent_calls_than_maxconn_wait(fake_pool):
+    db = PostgresDB(pooled=True, maxconn=2)
+    errors = []
+
+    def worker():
+        try:
+            with db.connection():
+                time.sleep(0.02)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert db.pool.peak == 2
+    assert db.pool.out == 0
+
+
+def test_pool_timeout(fake_pool):
+    db = PostgresDB(pooled=True, maxconn=1, pool_timeout=0.05)
+    with db.connection():
+        with pytest.raises(PoolError):
+            with db.connection():
+                pass
+    # Slot is released again after the failed checkout
+    with db.connection():
+        pass
+
+
+class _FakeProjectCursor:
+    """Answers _nearest_projects queries from an in-memory list of description docs"""
+
+    def __init__(self, docs, executed):
+        self.docs = docs            # [(project_id, distance)] sorted, NULL embeddings last
+        self.executed = executed
+        self.rows = []
+        self.connection = _FakeConnection()
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if params is None:
+            return
+        docs = self.docs
+        if "pe.embedding IS NOT NULL" in sql:
+            docs = [d for d in docs if d[1] is not None]
+        if "GROUP BY pe.project_id" in sql:
+            scanned = docs
+        else:
+            scanned = docs[:params[-2]]
+        # MIN(distance) is NULL only when every document of the project is NULL
+        best = {}
+        for project_id, distance in scanned:
+            if best.get(project_id) is None:
+                best[project_id] = distance
+        self.rows = [(p, d, len(scanned)) for p, d in best.items()][:params[-1]]
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def project_db(fake_pool, monkeypatch):
+    db = PostgresDB(pooled=True, maxconn=2)
+    # 10 projects, 5 description documents each, a project's documents are adjacent
+    docs = [(f"p{i // 5}", i / 100) for i in range(50)]
+    executed = []
+
+    @postgres_db.contextmanager
+    def cursor():
+        yield _FakeProjectCursor(docs, executed)
+
+    monkeypatch.setattr(db, 'cursor', cursor)
+    return db, executed
+
+
+def test_nearest_projects_widens_knn_until_enough_projects(project_db):
+    db, executed = project_db
+    best = db._nearest_projects([0.0], [], [], limit=5, docs_per_project=2)
+    assert [p for p, _ in best] == ["p0", "p1", "p2", "p3", "p4"]
+    # 10 -> 20 -> 40 candidates
+    assert sum("ORDER BY pe.embedding" in sql for sql in executed) == 3
+
+
+def test_nearest_projects_exact_scan_with_filters_on_old_pgvector(project_db, monkeypatch):
+    db, executed = project_db
+    monkeypatch.setattr(db, 'vector_extension_version', lambda: (0, 6, 2))
+    best = db._nearest_projects([0.0], ["pm.domain = %s"], ["shop"], limit=3)
+    assert [p for p, _ in best] == ["p0", "p1", "p2"]
+    assert not any("hnsw" in sql for sql in executed)
+    assert any("GROUP BY pe.project_id" in sql for sql in executed)
+
+
+def test_projects_with_null_embeddings_are_not_ranked(project_db, monkeypatch):
+    db, executed = project_db
+    monkeypatch.setattr(db, 'vector_extension_version', lambda: (0, 6, 2))
+    # Description rows of "px" were stored without an embedding
+    docs = [(f"p{i // 5}", i / 100) for i in range(50)] + [("px", None)] * 2
+
+    @postgres_db.contextmanager
+    def cursor():
+        yield _FakeProjectCursor(docs, executed)
+
+    monkeypatch.setattr(db, 'cursor', cursor)
+
+    best = db._nearest_projects([0.0], ["pm.domain = %s"], ["shop"], limit=20)
+    assert [p for p, _ in best] == [f"p{i}" for i in range(10)]
+
+    def fetch(sql, params=None, fetch="all"):
+        if "unnest" in sql:
+            return [(i, f"title {i}", i, "", "shop", [], [], [], "low", 1, [], d)
+                    for i, d in zip(*params)]
+        # Tail: projects without description embeddings
+        return [("px", "title px", "px", "", "shop", [], [], [], "low", 1, [])]
+
+    monkeypatch.setattr(db, '_fetch', fetch)
+    results = db.search_projects([0.0], filters={'domain': 'shop'}, limit=20)
+    assert [r["id"] for r in results] == [f"p{i}" for i in range(10)] + ["px"]
+
+
+def test_lexical_query_ors_content_words():
+    assert PostgresDB._lexical_query("find me an ecommerce app built with React") == "ecommerce | react"
+    assert PostgresDB._lexical_query("Tôi muốn tìm dự án bán hàng, bán hàng online") == "bán | hàng | online"
+    assert PostgresDB._lexical_query("") == ""
+
+
+class _FakeComponentCursor:
+    """Filtered component scan that comes back short (as an HNSW scan would)"""
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.connection = _FakeConnection()
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def fetchall(self):
+        return []
+
+
+@pytest.mark.parametrize("version", [(0, 6, 2), (0, 8, 0)])
+def test_filtered_component_search_with_typed_index_and_tags(fake_pool, monkeypatch, version):
+    db = PostgresDB(pooled=True, maxconn=2)
+    executed = []
+
+    @postgres_db.contextmanager
+    def cursor():
+        yield _FakeComponentCursor(executed)
+
+    monkeypatch.setattr(db, 'cursor', cursor)
+    monkeypatch.setattr(db, 'vector_extension_version', lambda: version)
+    monkeypatch.setattr(db, '_component_type_indexes', lambda: {'header'})
+    # Too many matching rows for the exact strategy
+    monkeypatch.setattr(db, '_fetch', lambda *args, **kwargs: (100000,))
+
+    db.search_components_filtered([0.0], limit=10, component_types=['header'], tags=['react'])
+
+    if version >= (0, 8):
+        assert any("iterative_scan" in sql for sql in executed)
+        assert not any("enable_indexscan = off" in sql for sql in executed)
+    else:
+        # Short filtered scan -> exact fallback
+        assert any("enable_indexscan = off" in sql for sql in executed)
+
+
+@pytest.mark.parametrize("version, expected", [
+    ((0, 7, 4), "enable_indexscan = off"),
+    ((0, 8, 0), "iterative_scan = strict_order"),
+])
+def test_quantized_shortlist_beyond_ef_search_cap(fake_pool, monkeypatch, version, expected):
+    db = PostgresDB(pooled=True, maxconn=2)
+    executed = []
+
+    @postgres_db.contextmanager
+    def cursor():
+        yield _FakeComponentCursor(executed)
+
+    monkeypatch.setattr(db, 'cursor', cursor)
+    monkeypatch.setattr(db, 'vector_extension_version', lambda: version)
+
+    db.search_components_quantized([0.0], limit=10, shortlist=500)
+    assert not any(expected in sql for sql in executed)
+
+    db.search_components_quantized([0.0], limit=10, shortlist=5000)
+    assert any(expected in sql for sql in executed)
+
+
+@pytest.mark.parametrize("filters, version, round_trips", [
+    (None, (0, 6, 2), 1),
+    ({'domain': 'shop'}, (0, 8, 0), 1),
+    ({'domain': 'shop'}, (0, 6, 2), 2),   # exact filtered ranking, then fusion
+])
+def test_hybrid_search_round_trips(fake_pool, monkeypatch, filters, version, round_trips):
+    db = PostgresDB(pooled=True, maxconn=2)
+    executed = []
+
+    @postgres_db.contextmanager
+    def cursor():
+        yield _FakeComponentCursor(executed)
+
+    monkeypatch.setattr(db, 'cursor', cursor)
+    monkeypatch.setattr(db, 'vector_extension_version', lambda: version)
+
+    assert db.search_projects_hybrid("react shop", [0.0], filters=filters) == []
+    assert sum(sql == "BEGIN" for sql in executed) == round_trips
+    fusion = executed[-2]
+    assert "rrf" in fusion
+    # Vector KNN runs inside the fusion statement unless the exact path is needed
+    assert ("ORDER BY pe.embedding <=>" in fusion) == (round_trips == 1)
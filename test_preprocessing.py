@@ -0,0 +1,106 @@
+"""
+Regression test: PaddedPreprocessor vs the original pad-then-resize preprocessing
+Run: python -m pytest -q test_preprocessing.py
+"""
+
+import sys
+import os
+sys.path.append(os.getcwd())
+
+import cv2
+import numpy as np
+import torch
+
+from src.preprocessing import PaddedPreprocessor
+
+# Mean abs difference allowed between old/new normalized tensors
+TENSOR_TOLERANCE = 0.05
+# Min cosine similarity between old/new CLIP embeddings
+EMBEDDING_TOLERANCE = 0.99
+
+
+def _reference_preprocess(image, target_size=224):
+    """Original EmbeddingService._preprocess_with_padding (pad full square, then resize)"""
+    h, w = image.shape[:2]
+    dim = max(h, w)
+    pad_h = (dim - h) // 2
+    pad_w = (dim - w) // 2
+
+    padded = np.zeros((dim, dim, 3), dtype=np.uint8)
+    padded[pad_h:pad_h+h, pad_w:pad_w+w] = image
+    resized = cv2.resize(padded, (target_size, target_size))
+
+    img_rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+    img_tensor = torch.from_numpy(img_rgb).permute(2, 0, 1).float() / 255.0
+
+    mean = torch.tensor([0.48145466, 0.4578275, 0.40821073]).view(3, 1, 1)
+    std = torch.tensor([0.26862954, 0.26130258, 0.27577711]).view(3, 1, 1)
+    return ((img_tensor - mean) / std).unsqueeze(0)
+
+
+def _sample_crops():
+    """UI-like crops: smooth gradients + flat blocks, in header/sidebar/card shapes"""
+    rng = np.random.default_rng(0)
+    crops = []
+    for h, w in [(80, 1920), (900, 240), (300, 300), (224, 224), (37, 501), (640, 480)]:
+        yy, xx = np.mgrid[0:h, 0:w]
+        img = np.stack([
+            (xx * 255 // max(w - 1, 1)),
+            (yy * 255 // max(h - 1, 1)),
+            np.full((h, w), 128),
+        ], axis=-1).astype(np.uint8)
+        # A few solid "buttons"
+        for _ in range(3):
+            x0, y0 = rng.integers(0, w // 2), rng.integers(0, h // 2)
+            img[y0:y0 + h // 4, x0:x0 + w // 4] = rng.integers(0, 255, 3)
+        crops.append(img)
+    return crops
+
+
+def test_single_matches_reference():
+    pre = PaddedPreprocessor()
+    for crop in _sample_crops():
+        new = pre(crop)
+        old = _reference_preprocess(crop)
+        assert new.shape == old.shape == (1, 3, 224, 224)
+        diff = (new - old).abs().mean().item()
+        assert diff < TENSOR_TOLERANCE, f"{crop.shape}: mean abs diff {diff:.4f}"
+
+
+def test_batch_matches_single():
+    pre = PaddedPreprocessor()
+    crops = _sample_crops()
+    batch = pre.batch(crops)
+    assert batch.shape == (len(crops), 3, 224, 224)
+    for i, crop in enumerate(crops):
+        assert torch.allclose(batch[i:i+1], pre(crop))
+
+
+def test_embeddings_match_reference():
+    """Needs CLIP weights; skipped when the model cannot be loaded"""
+    import pytest
+    pytest.importorskip("clip")
+    from src.model_registry import get_clip
+
+    try:
+        model, _ = get_clip("ViT-B/32", "cpu")
+    except Exception as e:
+        pytest.skip(f"CLIP weights unavailable: {e}")
+
+    crops = _sample_crops()
+    pre = PaddedPreprocessor()
+    with torch.no_grad():
+        new = model.encode_image(pre.batch(crops))
+        old = model.encode_image(torch.cat([_reference_preprocess(c) for c in crops]))
+    new = new / new.norm(dim=-1, keepdim=True)
+    old = old / old.norm(dim=-1, keepdim=True)
+
+    cos = (new * old).sum(dim=-1)
+    assert cos.min().item() > EMBEDDING_TOLERANCE, cos.tolist()
+
+
+if __name__ == "__main__":
+    test_single_matches_reference()
+    test_batch_matches_single()
+    test_embeddings_match_reference()
+    print("✓ Preprocessing matches reference")